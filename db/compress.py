@@ -3,6 +3,8 @@
 
 """from python cookbook 2nd edition."""
 import gzip
+import io
+import zlib
 
 try:
     import cPickle as pickle
@@ -12,18 +14,41 @@ except ImportError:
 
 def save_pgz(filename, *objs):
     """save objects into compressed file."""
-    f = gzip.open(filename, 'wb')
+    save_pgz_iter(filename, objs)
+
+
+def save_pgz_iter(filename, objs, compresslevel=9):
+    """same as save_pgz(), but objs can be any iterable, even a generator,
+    so the objects never have to be in memory at once."""
+    f = gzip.open(filename, 'wb', compresslevel)
     for o in objs:
-        pickle.dump(o, f, proto=2)
+        pickle.dump(o, f, 2)
     f.close()
 
 
 def load_pgz(filename):
     """load objects from compressed file."""
-    f = gzip.open(filename, 'rb')
+    # pickle.load() makes lots of small reads, which are slow on a bare
+    # GzipFile in python 2.
+    f = io.BufferedReader(gzip.open(filename, 'rb'))
     while True:
         try:
             yield pickle.load(f)
         except EOFError:
             break
     f.close()
+
+
+def dumps_pz(obj):
+    """pickle an object into a compressed string.
+
+    Example:
+    >>> loads_pz(dumps_pz({'a': [1, 2]}))
+    {'a': [1, 2]}
+    """
+    return zlib.compress(pickle.dumps(obj, 2))
+
+
+def loads_pz(s):
+    """load an object from a string made by dumps_pz()."""
+    return pickle.loads(zlib.decompress(s))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A dict kept in a memory-mapped, append-only file."""
+import mmap
+import os
+import UserDict
+
+from snippetpy.db.compress import dumps_pz, loads_pz
+
+
+class MmapStore(object, UserDict.DictMixin):
+    """A mapping whose values are pickled into a memory-mapped file.
+
+    Each value is appended to the file as a dumps_pz() record and an index
+    in memory maps the key to (offset, size), so a lookup is one dict access
+    plus the unpickling. The file grows by doubling, so it is remapped only
+    O(log n) times. Overwritten and deleted records are left behind as
+    garbage, the file is compacted once that is over half of it.
+
+    The file is truncated when opened, the store lives as long as the
+    process, see FIFOCache(spill=...).
+
+    Example:
+    >>> import os, tempfile
+    >>> fd, filename = tempfile.mkstemp()
+    >>> s = MmapStore(filename)
+    >>> s['a'] = range(3)
+    >>> s['b'] = 'x' * 10000
+    >>> s['a'] = 'new'
+    >>> s['a'], len(s['b']), sorted(s.keys())
+    ('new', 10000, ['a', 'b'])
+    >>> s.close()
+    >>> os.close(fd); os.remove(filename)
+    """
+    # the initial size of the file
+    min_size = 1 << 20
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.index = {}
+        self.end = 0
+        self.garbage = 0
+        self._open(filename, self.min_size)
+
+    def _open(self, filename, size):
+        self.f = open(filename, 'w+b')
+        self.f.truncate(size)
+        self.mm = mmap.mmap(self.f.fileno(), size)
+
+    def _grow(self, need):
+        size = len(self.mm)
+        while size < need:
+            size *= 2
+        self.mm.close()
+        self.f.truncate(size)
+        self.mm = mmap.mmap(self.f.fileno(), size)
+
+    def __getitem__(self, key):
+        offset, size = self.index[key]
+        return loads_pz(self.mm[offset:offset + size])
+
+    def __setitem__(self, key, value):
+        data = dumps_pz(value)
+        old = self.index.get(key)
+        if old is not None:
+            self.garbage += old[1]
+        end = self.end + len(data)
+        if end > len(self.mm):
+            self._grow(end)
+        self.mm[self.end:end] = data
+        self.index[key] = self.end, len(data)
+        self.end = end
+        if self.garbage > max(self.end // 2, self.min_size):
+            self.compact()
+
+    def __delitem__(self, key):
+        offset, size = self.index.pop(key)
+        self.garbage += size
+
+    def __contains__(self, key):
+        return key in self.index
+    has_key = __contains__
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self.index)
+
+    def clear(self):
+        self.index.clear()
+        self.end = self.garbage = 0
+
+    def compact(self):
+        """rewrite the live records into a new file."""
+        old_f, old_mm = self.f, self.mm
+        tmp = self.filename + '.compact'
+        self._open(tmp, max(self.min_size, self.end - self.garbage))
+        index = {}
+        end = 0
+        for key, (offset, size) in self.index.iteritems():
+            if end + size > len(self.mm):
+                self._grow(end + size)
+            self.mm[end:end + size] = old_mm[offset:offset + size]
+            index[key] = end, size
+            end += size
+        old_mm.close()
+        old_f.close()
+        os.rename(tmp, self.filename)
+        self.index = index
+        self.end = end
+        self.garbage = 0
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""The PriorityQueue of ds/priorityqueue.py, for asyncio."""
+import asyncio
+import heapq
+import itertools
+
+
+class _Entry(tuple):
+    """(priority, seq, item), what put() hands to put_nowait()."""
+    __slots__ = ()
+
+
+class AsyncPriorityQueue(asyncio.Queue):
+    """An asyncio.Queue of items by priority, lowest first.
+
+    put(item, priority) and get() work like those of PriorityQueue, with
+    items of the same priority first in first out, but wait in the event
+    loop instead of blocking a thread. get() is asyncio.Queue.get(): if it
+    is cancelled, no item is lost. get_many(max_n) waits the same way for
+    the first item only, then takes up to max_n - 1 more without waiting,
+    so it cannot be cancelled with items taken.
+
+    Example:
+    >>> async def main():
+    ...     q = AsyncPriorityQueue()
+    ...     await q.put('b', 1)
+    ...     q.put_nowait('c', 1)
+    ...     await q.put('a', 0)
+    ...     first = await q.get()
+    ...     return first, await q.get_many(5)
+    >>> asyncio.run(main())
+    ('a', ['b', 'c'])
+    """
+    def _init(self, maxsize):
+        self._queue = []
+        self._counter = itertools.count()
+
+    def _put(self, entry):
+        heapq.heappush(self._queue, entry)
+
+    def _get(self):
+        return heapq.heappop(self._queue)
+
+    async def put(self, item, priority=0):
+        entry = _Entry((priority, next(self._counter), item))
+        await asyncio.Queue.put(self, entry)
+
+    def put_nowait(self, item, priority=0):
+        # asyncio.Queue.put() ends in put_nowait(), with an _Entry
+        if type(item) is not _Entry:
+            item = _Entry((priority, next(self._counter), item))
+        asyncio.Queue.put_nowait(self, item)
+
+    def get_nowait(self):
+        return asyncio.Queue.get_nowait(self)[2]
+
+    async def get_many(self, max_n):
+        """get 1 to max_n items as a list, waiting only for the first."""
+        items = [await self.get()]
+        while len(items) < max_n and not self.empty():
+            items.append(self.get_nowait())
+        return items
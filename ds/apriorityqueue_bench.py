@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the queue in ds/apriorityqueue.py.
+
+Usage: python3 -m snippetpy.ds.apriorityqueue_bench [name ...]
+Run without names to run all of them.
+"""
+import asyncio
+import random
+import sys
+from timeit import default_timer
+
+from snippetpy.ds.apriorityqueue import AsyncPriorityQueue
+from snippetpy.ds.priorityqueue import PriorityQueue
+
+
+async def _async_get(q, n, batch):
+    got = 0
+    while got < n:
+        if batch:
+            got += len(await q.get_many(batch))
+        else:
+            await q.get()
+            got += 1
+
+
+async def _executor_get(q, n, batch):
+    loop = asyncio.get_running_loop()
+    got = 0
+    while got < n:
+        if batch:
+            got += len(await loop.run_in_executor(None, q.get_many, batch))
+        else:
+            await loop.run_in_executor(None, q.get)
+            got += 1
+
+
+async def _produce(q, items, put):
+    for i, (item, priority) in enumerate(items):
+        await put(q, item, priority)
+        if i % 64 == 0:
+            # let the consumer run, as the producers of a service would
+            await asyncio.sleep(0)
+
+
+async def _put_async(q, item, priority):
+    await q.put(item, priority)
+
+
+async def _put_thread(q, item, priority):
+    q.put(item, priority)
+
+
+def bench_asyncio(n=50000, maxsize=1000, batch=64):
+    """A producer and a consumer coroutine: AsyncPriorityQueue vs the
+    threading PriorityQueue, got through run_in_executor()."""
+    print('%-44s %12s' % ('queue', 'items/sec'))
+    items = [(i, random.randint(0, 15)) for i in range(n)]
+    for name, cls, get, put in (
+            ('PriorityQueue + run_in_executor', PriorityQueue,
+             _executor_get, _put_thread),
+            ('AsyncPriorityQueue', AsyncPriorityQueue, _async_get,
+             _put_async)):
+        for b in (0, batch):
+            async def run():
+                # unbounded for the threading queue, whose put() would
+                # block the event loop
+                q = cls(maxsize if cls is AsyncPriorityQueue else 0)
+                await asyncio.gather(_produce(q, items, put),
+                                     get(q, n, b))
+            start = default_timer()
+            asyncio.run(run())
+            label = name + (' get_many(%d)' % b if b else '')
+            print('%-44s %12.0f' % (label, n / (default_timer() - start)))
+
+
+BENCHMARKS = {
+    'asyncio': bench_asyncio,
+}
+
+
+def main(argv):
+    for name in argv or sorted(BENCHMARKS):
+        print('== %s' % name, file=sys.stderr)
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
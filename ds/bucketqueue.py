@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Priority queues of integer priorities, without comparisons."""
+import collections
+
+from snippetpy.ds.priorityqueue import PriorityQueue
+
+
+class _BucketQueue(PriorityQueue):
+    """the size bookkeeping of the queues of buckets below."""
+    def _qsize(self):
+        return self.count
+
+    def _empty(self):
+        return not self.count
+
+    def _full(self):
+        return self.maxsize > 0 and self.count >= self.maxsize
+
+    def _put_batch(self, entries):
+        for entry in entries:
+            self._check(entry[0])
+        for entry in entries:
+            self._put(entry)
+
+
+class BucketPriorityQueue(_BucketQueue):
+    """A PriorityQueue of the priorities 0 to levels - 1.
+
+    There is a deque per priority, put() appends to one and get() pops
+    from the lowest non-empty one, so both are O(1) whatever the number
+    of items, only the empty levels below are skipped. Items of the same
+    priority come out first in first out, as in PriorityQueue.
+
+    Example:
+    >>> q = BucketPriorityQueue(levels=4)
+    >>> q.put_many([('x', 3), ('a', 0), ('y', 3), ('b', 1)])
+    >>> q.get(), q.get(), q.get_many(5)
+    ('a', 'b', ['x', 'y'])
+    >>> q.put('z', 4)
+    Traceback (most recent call last):
+        ...
+    ValueError: priority 4 not in 0..3
+    """
+    def __init__(self, maxsize=0, levels=16):
+        self.levels = levels
+        PriorityQueue.__init__(self, maxsize)
+
+    def _init(self, maxsize):
+        PriorityQueue._init(self, maxsize)
+        self.queue = [collections.deque() for i in range(self.levels)]
+        self.count = 0
+        # no item has a priority below lowest
+        self.lowest = self.levels
+
+    def _check(self, priority):
+        if not 0 <= priority < self.levels:
+            raise ValueError('priority %r not in 0..%d'
+                             % (priority, self.levels - 1))
+
+    def _put(self, entry):
+        priority = entry[0]
+        self._check(priority)
+        self.queue[priority].append(entry)
+        self.count += 1
+        if priority < self.lowest:
+            self.lowest = priority
+
+    def _get(self):
+        queue = self.queue
+        lowest = self.lowest
+        while not queue[lowest]:
+            lowest += 1
+        self.lowest = lowest
+        self.count -= 1
+        return queue[lowest].popleft()
+
+
+class RadixPriorityQueue(_BucketQueue):
+    """A PriorityQueue of monotone integer priorities, a radix heap.
+
+    The priorities are ints >= 0 that never go below the last one got,
+    like timestamps or the distances of Dijkstra's algorithm. An item
+    goes to bucket i, the bit length of priority ^ last, so bucket 0 has
+    the items of priority last. When bucket 0 is empty, get() takes the
+    lowest non-empty bucket, makes its minimum the new last and spreads
+    its items in the buckets below. put() is O(1), an item moves down at
+    most once per bit of the priorities, so get() is amortized O(bits).
+    Items of the same priority come out first in first out.
+
+    Example:
+    >>> q = RadixPriorityQueue()
+    >>> q.put_many([('c', 1000), ('a', 5), ('b', 7), ('a2', 5)])
+    >>> q.get(), q.get()
+    ('a', 'a2')
+    >>> q.put('too late', 4)
+    Traceback (most recent call last):
+        ...
+    ValueError: priority 4 below the last one got, 5
+    >>> q.get_many(5)
+    ['b', 'c']
+    """
+    def _init(self, maxsize):
+        PriorityQueue._init(self, maxsize)
+        self.queue = [collections.deque()]
+        self.count = 0
+        self.last = 0
+
+    def _check(self, priority):
+        if priority < self.last:
+            raise ValueError('priority %r below the last one got, %r'
+                             % (priority, self.last))
+
+    def _put(self, entry):
+        priority = entry[0]
+        self._check(priority)
+        queue = self.queue
+        i = (priority ^ self.last).bit_length()
+        while len(queue) <= i:
+            queue.append(collections.deque())
+        queue[i].append(entry)
+        self.count += 1
+
+    def _get(self):
+        queue = self.queue
+        if not queue[0]:
+            i = 1
+            while not queue[i]:
+                i += 1
+            bucket = queue[i]
+            queue[i] = collections.deque()
+            last = self.last = min(entry[0] for entry in bucket)
+            for entry in bucket:
+                queue[(entry[0] ^ last).bit_length()].append(entry)
+        self.count -= 1
+        return queue[0].popleft()
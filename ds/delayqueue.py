@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Queues of items that can be got only once they are due."""
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+import collections
+import time
+
+from snippetpy.ds.priorityqueue import IndexedPriorityQueue, PRIORITY, ITEM
+from snippetpy.ds.priorityqueue import POS, SEQ, wait_until
+from snippetpy.ds.timingwheel import TimingWheel
+
+
+class DelayQueue(IndexedPriorityQueue):
+    """A queue whose items are hidden until their due time.
+
+    put(item, delay) returns a handle to cancel() or reschedule() the item,
+    get() and get_many() return due items only, the earliest first. The
+    items are kept in an IndexedPriorityQueue by deadline, so put, cancel
+    and reschedule are O(log n). One waiting thread, the leader, sleeps
+    until the earliest deadline, the others sleep until they are needed,
+    and a put() wakes one only when the new item is the earliest.
+    qsize() counts all the items, due or not.
+
+    Deadlines are timer() + delay, timer is time.time by default.
+
+    Example:
+    >>> q = DelayQueue()
+    >>> later = q.put('later', 0.05)
+    >>> never = q.put('never', 0.01)
+    >>> now = q.put('now')
+    >>> q.get(), q.cancel(never), q.qsize()
+    ('now', True, 1)
+    >>> try:
+    ...     q.get(block=False)
+    ... except Queue.Empty:
+    ...     print('nothing due yet')
+    nothing due yet
+    >>> q.get(timeout=1)
+    'later'
+    """
+    def __init__(self, maxsize=0, timer=time.time):
+        self.timer = timer
+        IndexedPriorityQueue.__init__(self, maxsize)
+
+    def _init(self, maxsize):
+        IndexedPriorityQueue._init(self, maxsize)
+        # the token of the get() sleeping until the next deadline
+        self.leader = None
+
+    def _handle(self, entry):
+        return entry
+
+    def _wake(self, entry):
+        """a waiter is needed after entry was put."""
+        if entry[POS] == 0:
+            self.leader = None
+            self.not_empty.notify()
+
+    def _put_batch(self, entries):
+        head = self.queue[0] if self.queue else None
+        IndexedPriorityQueue._put_batch(self, entries)
+        if self.queue[0] is not head:
+            # _put_many() notifies, one of them leads instead
+            self.leader = None
+
+    def _pop_due(self, now):
+        """the entry of a due item, or None."""
+        if self.queue and self.queue[0][PRIORITY] <= now:
+            return self._get()
+        return None
+
+    def _wait_time(self, now):
+        """how long until an item may be due, None if there is none."""
+        if self.queue:
+            return self.queue[0][PRIORITY] - now
+        return None
+
+    def put(self, item, delay=0, block=True, timeout=None):
+        """put item, due in delay seconds, return its handle."""
+        entry = [self.timer() + delay, next(self.counter), item, None]
+        self.not_full.acquire()
+        try:
+            wait_until(self.not_full, self._room, block, timeout, Queue.Full)
+            self._put(entry)
+            self.unfinished_tasks += 1
+            self._wake(entry)
+        finally:
+            self.not_full.release()
+        return self._handle(entry)
+
+    def put_many(self, items, block=True, timeout=None):
+        """put (item, delay) pairs, return their handles.
+
+        Queue.Full is raised as by IndexedPriorityQueue.put_many().
+        """
+        now = self.timer()
+        counter = self.counter
+        entries = [[now + delay, next(counter), item, None]
+                   for item, delay in items]
+        try:
+            self._put_many(entries, block, timeout)
+        except Queue.Full as e:
+            e.handles = [self._handle(entry) for entry in entries[:e.count]]
+            raise
+        return [self._handle(entry) for entry in entries]
+
+    def get(self, block=True, timeout=None):
+        return self._take(1, block, timeout)[0]
+
+    def get_many(self, max_n, block=True, timeout=None):
+        """get 1 to max_n due items as a list, waiting only for the
+        first."""
+        return self._take(max_n, block, timeout)
+
+    def _take(self, max_n, block, timeout):
+        token = object()
+        self.not_empty.acquire()
+        try:
+            if timeout is not None:
+                end = time.time() + timeout
+            while True:
+                now = self.timer()
+                entry = self._pop_due(now)
+                if entry is not None:
+                    break
+                if not block:
+                    raise Queue.Empty
+                remaining = None
+                if timeout is not None:
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        raise Queue.Empty
+                wait = self._wait_time(now)
+                if wait is None or self.leader is not None:
+                    self.not_empty.wait(remaining)
+                    continue
+                self.leader = token
+                try:
+                    if remaining is not None:
+                        wait = min(wait, remaining)
+                    self.not_empty.wait(wait)
+                finally:
+                    if self.leader is token:
+                        self.leader = None
+            entries = [entry]
+            while len(entries) < max_n:
+                entry = self._pop_due(now)
+                if entry is None:
+                    break
+                entries.append(entry)
+            self.not_full.notify(len(entries))
+        finally:
+            # hand the watch over to another waiter, also when we leave
+            # without an item, e.g. the leader timing out
+            if (self.leader is None and
+                    self._wait_time(self.timer()) is not None):
+                self.not_empty.notify()
+            self.not_empty.release()
+        return [entry[ITEM] for entry in entries]
+
+    def update_priority(self, handle, deadline):
+        """move a queued item to another deadline."""
+        IndexedPriorityQueue.update_priority(self, handle, deadline)
+        self.not_empty.acquire()
+        try:
+            self._wake(handle)
+        finally:
+            self.not_empty.release()
+
+    def reschedule(self, handle, delay):
+        """make a queued item due in delay seconds."""
+        self.update_priority(handle, self.timer() + delay)
+
+    def cancel(self, handle):
+        """remove a queued item, return False if it was not queued."""
+        try:
+            self.remove(handle)
+        except ValueError:
+            return False
+        return True
+
+
+class WheelDelayQueue(DelayQueue):
+    """A DelayQueue over a TimingWheel.
+
+    put, cancel and reschedule are O(1) whatever the number of items, but
+    the deadlines are rounded up to a tick. The leader sleeps until the
+    next tick with a timer to expire or to cascade down the wheel, at most
+    `levels` wake ups per item. Items due in the same tick come out by
+    deadline, and in order of put for equal deadlines. The handles are
+    ints.
+
+    Example:
+    >>> q = WheelDelayQueue(tick=0.01)
+    >>> handles = q.put_many([('b', 0.03), ('a', 0.02), ('c', 0.05)])
+    >>> q.cancel(handles[2])
+    True
+    >>> q.get_many(5, timeout=1) + q.get_many(5, timeout=1)
+    ['a', 'b']
+    """
+    def __init__(self, maxsize=0, timer=time.time, tick=0.01, slots=256,
+                 levels=4):
+        self.wheel = TimingWheel(tick, slots, levels, timer())
+        DelayQueue.__init__(self, maxsize, timer)
+
+    def _init(self, maxsize):
+        DelayQueue._init(self, maxsize)
+        # seq -> entry of the items queued, the seq of the expired ones
+        self.entries = {}
+        self.ready = collections.deque()
+
+    def _qsize(self):
+        return len(self.entries)
+
+    def _handle(self, entry):
+        return entry[SEQ]
+
+    def _wake(self, entry):
+        if self.leader is None:
+            self.not_empty.notify()
+
+    def _put(self, entry):
+        self.entries[entry[SEQ]] = entry
+        self.wheel.schedule(entry[SEQ], entry[PRIORITY])
+
+    def _put_batch(self, entries):
+        for entry in entries:
+            self._put(entry)
+
+    def _pop_due(self, now):
+        ready = self.ready
+        if not ready:
+            self.wheel.advance(now)
+            ready.extend(seq for deadline, seq in
+                         sorted((d, s) for s, d in self.wheel.expired()))
+        entries = self.entries
+        while ready:
+            seq = ready.popleft()
+            # skip the cancelled and the rescheduled ones
+            if seq in entries and seq not in self.wheel:
+                return entries.pop(seq)
+        return None
+
+    def _wait_time(self, now):
+        if not self.entries:
+            return None
+        if self.ready:
+            return 0
+        expiry = self.wheel.next_expiry()
+        if expiry is None:
+            return None
+        return max(expiry - now, 0)
+
+    def update_priority(self, handle, deadline):
+        self.not_empty.acquire()
+        try:
+            entry = self.entries.get(handle)
+            if entry is None:
+                raise ValueError('the item is not in the queue')
+            entry[PRIORITY] = deadline
+            self.wheel.schedule(handle, deadline)
+            self._wake(entry)
+        finally:
+            self.not_empty.release()
+
+    def remove(self, handle):
+        self.mutex.acquire()
+        try:
+            entry = self.entries.pop(handle, None)
+            if entry is None:
+                raise ValueError('the item is not in the queue')
+            self.wheel.cancel(handle)
+            self.unfinished_tasks -= 1
+            if not self.unfinished_tasks:
+                self.all_tasks_done.notify_all()
+            self.not_full.notify()
+        finally:
+            self.mutex.release()
+        return entry[ITEM]
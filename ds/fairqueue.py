@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A queue shared fairly by tenants, weighted fair queuing."""
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+import collections
+import heapq
+import time
+
+from snippetpy.ds.priorityqueue import PriorityQueue
+from snippetpy.ds.ringbuffer import TimeWindow
+
+
+class _Tenant(object):
+    __slots__ = ('name', 'weight', 'queue', 'finish', 'delays')
+
+    def __init__(self, name, weight, window):
+        self.name = name
+        self.weight = weight
+        # (finish tag, time put, item)
+        self.queue = collections.deque()
+        self.finish = 0
+        self.delays = window
+
+
+class FairQueue(PriorityQueue):
+    """A queue of the items of many tenants, each getting a fair share.
+
+    put(item, tenant, cost) queues item in the deque of its tenant, with a
+    virtual finish tag: the finish tag of the tenant's previous item, or
+    the virtual time if that is later, plus cost / weight of the tenant.
+    get() serves the item of the smallest tag and moves the virtual time
+    to it (self-clocked fair queuing). So a tenant flooding the queue only
+    delays its own items, and over time the tenants are served in
+    proportion to their weights. The tenants with items are in a heap by
+    the tag of their first item, put and get are O(log tenants).
+
+    Each tenant has a TimeWindow of the delays of its items got during the
+    last `window` seconds, see stats(). Weights are 1 unless given in
+    weights or set with set_weight().
+
+    Example:
+    >>> q = FairQueue(weights={'gold': 2})
+    >>> q.put_many([('n%d' % i, 'noisy') for i in range(4)])
+    >>> q.put('g0', 'gold')
+    >>> q.put('g1', 'gold')
+    >>> q.put('q0', 'quiet')
+    >>> q.get_many(10)
+    ['g0', 'n0', 'q0', 'g1', 'n1', 'n2', 'n3']
+    >>> q.stats('noisy')['served'], q.stats('noisy')['queued']
+    (4, 0)
+    """
+    def __init__(self, maxsize=0, weights=None, timer=time.time,
+                 window=60.0):
+        self.weights = dict(weights or {})
+        self.timer = timer
+        self.window = window
+        PriorityQueue.__init__(self, maxsize)
+
+    def _init(self, maxsize):
+        PriorityQueue._init(self, maxsize)
+        self.tenants = {}
+        # (finish tag of the first item, seq, tenant) of the busy tenants
+        self.queue = []
+        self.count = 0
+        self.vtime = 0
+
+    def _qsize(self):
+        return self.count
+
+    def _tenant(self, name):
+        tenant = self.tenants.get(name)
+        if tenant is None:
+            tenant = self.tenants[name] = _Tenant(
+                name, self.weights.get(name, 1),
+                TimeWindow(self.window, 12, self.timer))
+        return tenant
+
+    def _put(self, entry):
+        name, cost, item = entry
+        tenant = self._tenant(name)
+        finish = tenant.finish = \
+            max(self.vtime, tenant.finish) + float(cost) / tenant.weight
+        if not tenant.queue:
+            heapq.heappush(self.queue, (finish, next(self.counter), tenant))
+        tenant.queue.append((finish, self.timer(), item))
+        self.count += 1
+
+    def _put_batch(self, entries):
+        for entry in entries:
+            self._put(entry)
+
+    def _get(self):
+        finish, seq, tenant = heapq.heappop(self.queue)
+        finish, put_time, item = tenant.queue.popleft()
+        if tenant.queue:
+            heapq.heappush(self.queue, (tenant.queue[0][0],
+                                        next(self.counter), tenant))
+        self.vtime = finish
+        self.count -= 1
+        now = self.timer()
+        tenant.delays.add(now - put_time, now)
+        return tenant.name, finish, item
+
+    def put(self, item, tenant=None, cost=1, block=True, timeout=None):
+        """put item for tenant, cost is its share of the work."""
+        Queue.Queue.put(self, (tenant, cost, item), block, timeout)
+
+    def put_many(self, items, block=True, timeout=None):
+        """put (item, tenant) pairs, of cost 1."""
+        self._put_many([(tenant, 1, item) for item, tenant in items],
+                       block, timeout)
+
+    def set_weight(self, tenant, weight):
+        """the share of tenant, for the items put from now on."""
+        self.mutex.acquire()
+        try:
+            self.weights[tenant] = weight
+            self._tenant(tenant).weight = weight
+        finally:
+            self.mutex.release()
+
+    def stats(self, tenant):
+        """the items of tenant queued, and served in the last window with
+        their queueing delays."""
+        self.mutex.acquire()
+        try:
+            t = self._tenant(tenant)
+            delays = t.delays
+            return {'queued': len(t.queue),
+                    'served': delays.count(),
+                    'mean_delay': delays.mean(),
+                    'max_delay': delays.max(),
+                    'p50_delay': delays.percentile(50),
+                    'p99_delay': delays.percentile(99)}
+        finally:
+            self.mutex.release()
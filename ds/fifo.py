@@ -85,12 +85,395 @@ class FIFODeque(collections.deque):
     pop = collections.deque.popleft
 
 
+import Queue
+import sys
+import threading
+import time
+
+from snippetpy.ds.priorityqueue import wait_until
+
+
+class BlockingFIFO(object):
+    """a bounded, thread-safe FIFO based on a FIFODeque.
+
+    put() and get() work like those of Queue.Queue and raise Queue.Full and
+    Queue.Empty the same way. put_many() and get_many() move a whole batch
+    per lock acquisition, so a consumer can drain up to max_n items for the
+    price of one get(). maxsize <= 0 means unbounded.
+
+    Example:
+    >>> q = BlockingFIFO(maxsize=3)
+    >>> q.put_many(range(3))
+    >>> q.full()
+    True
+    >>> q.get_many(10)
+    [0, 1, 2]
+    >>> q.get_many(10, timeout=0.01)
+    Traceback (most recent call last):
+        ...
+    Empty
+    >>> q.put_many(range(5), timeout=0.01)
+    Traceback (most recent call last):
+        ...
+    Full
+    >>> q.get_many(10)
+    [0, 1, 2]
+    """
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.fifo = FIFODeque()
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+
+    def qsize(self):
+        with self.mutex:
+            return len(self.fifo)
+
+    def empty(self):
+        with self.mutex:
+            return not self.fifo
+
+    def full(self):
+        with self.mutex:
+            return 0 < self.maxsize <= len(self.fifo)
+
+    def _room(self):
+        if self.maxsize <= 0:
+            return sys.maxint
+        return self.maxsize - len(self.fifo)
+
+    def put(self, item, block=True, timeout=None):
+        with self.not_full:
+            if 0 < self.maxsize <= len(self.fifo):
+                wait_until(self.not_full, self._room, block, timeout,
+                           Queue.Full)
+            self.fifo.append(item)
+            self.not_empty.notify()
+
+    def put_many(self, items, block=True, timeout=None):
+        """put all the items.
+
+        Up to maxsize items go in all at once or not at all. More go in as
+        the room frees up, each wait up to timeout seconds, and part of
+        them may be queued when Queue.Full is raised: its count attribute
+        says how many.
+        """
+        items = list(items)
+        # a batch that fits waits for room for all of it
+        want = len(items) if len(items) <= self.maxsize else 1
+        pos = 0
+        with self.not_full:
+            while pos < len(items):
+                try:
+                    wait_until(self.not_full, lambda: self._room() >= want,
+                               block, timeout, Queue.Full)
+                except Queue.Full as e:
+                    e.count = pos
+                    raise
+                n = min(self._room(), len(items) - pos)
+                self.fifo.extend(items[pos:pos + n])
+                pos += n
+                self.not_empty.notify(n)
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            if not self.fifo:
+                wait_until(self.not_empty, self.fifo.__len__, block, timeout,
+                           Queue.Empty)
+            item = self.fifo.pop()
+            self.not_full.notify()
+            return item
+
+    def get_many(self, max_n, block=True, timeout=None):
+        """get 1 to max_n items as a list, waiting only for the first."""
+        with self.not_empty:
+            wait_until(self.not_empty, self.fifo.__len__, block, timeout,
+                       Queue.Empty)
+            pop = self.fifo.pop
+            items = [pop() for i in range(min(max_n, len(self.fifo)))]
+            self.not_full.notify(len(items))
+            return items
+
+
+import array
+
+
+class FIFOArray(object):
+    """a FIFO of numbers, kept unboxed in array.array chunks.
+
+    The elements are stored as C values of typecode (see the array module),
+    8 bytes for a 'd' where a FIFODeque holds a pointer to a float object of
+    24 bytes more. append() and pop() are O(1), extend() and pop_many() copy
+    whole slices and pop_many() returns an array.
+
+    Example:
+    >>> f = FIFOArray('i', chunk_size=4)
+    >>> f.extend(range(10))
+    >>> f.append(10)
+    >>> f.pop()
+    0
+    >>> f.pop_many(5)
+    array('i', [1, 2, 3, 4, 5])
+    >>> len(f), list(f)
+    (5, [6, 7, 8, 9, 10])
+    """
+    def __init__(self, typecode='d', chunk_size=8192):
+        self.typecode = typecode
+        self.chunk_size = chunk_size
+        self.chunks = collections.deque([array.array(typecode)])
+        # index of the first element in chunks[0]
+        self.head = 0
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        head = self.head
+        for chunk in self.chunks:
+            for x in chunk[head:]:
+                yield x
+            head = 0
+
+    def append(self, x):
+        tail = self.chunks[-1]
+        if len(tail) == self.chunk_size:
+            tail = array.array(self.typecode)
+            self.chunks.append(tail)
+        tail.append(x)
+        self.length += 1
+
+    def extend(self, data):
+        if not isinstance(data, array.array) or data.typecode != self.typecode:
+            data = array.array(self.typecode, data)
+        chunks = self.chunks
+        chunk_size = self.chunk_size
+        pos = 0
+        while pos < len(data):
+            tail = chunks[-1]
+            room = chunk_size - len(tail)
+            if not room:
+                tail = array.array(self.typecode)
+                chunks.append(tail)
+                room = chunk_size
+            tail.extend(data[pos:pos + room])
+            pos += room
+        self.length += len(data)
+
+    def _consumed(self, n):
+        """n elements were taken from chunks[0]."""
+        self.head += n
+        self.length -= n
+        if self.head == len(self.chunks[0]):
+            if len(self.chunks) > 1:
+                self.chunks.popleft()
+            else:
+                del self.chunks[0][:]
+            self.head = 0
+
+    def pop(self):
+        if not self.length:
+            raise IndexError('pop from an empty FIFO')
+        x = self.chunks[0][self.head]
+        self._consumed(1)
+        return x
+
+    def pop_many(self, n):
+        """pop up to n elements, as an array."""
+        if n < 0:
+            raise ValueError('pop_many() needs n >= 0, not %r' % (n,))
+        result = array.array(self.typecode)
+        n = min(n, self.length)
+        while n:
+            head = self.head
+            first = self.chunks[0]
+            take = min(n, len(first) - head)
+            result.extend(first[head:head + take])
+            self._consumed(take)
+            n -= take
+        return result
+
+
+import os
+import types
 import UserDict
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from snippetpy.db.compress import save_pgz_iter, load_pgz
+from snippetpy.ds.timingwheel import TimingWheel
+
+# indexes into a link of the cache's doubly linked list, WEIGHT is only
+# there when the cache has a weigher.
+PREV, NEXT, KEY, VALUE, WEIGHT = 0, 1, 2, 3, 4
+
+_OPAQUE = (type, types.ClassType, types.ModuleType, types.FunctionType,
+           types.MethodType, types.BuiltinFunctionType)
+
+
+def deep_sizeof(obj):
+    """estimate the bytes used by obj and all the objects it refers to.
+
+    Containers, instance __dict__ and __slots__ are followed, classes,
+    modules and functions are counted but not followed.
+
+    Example:
+    >>> deep_sizeof([]) < deep_sizeof(['x' * 1000])
+    True
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        if isinstance(o, _OPAQUE):
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, collections.deque)):
+            stack.extend(o)
+        if hasattr(o, '__dict__'):
+            stack.append(o.__dict__)
+        for name in getattr(type(o), '__slots__', ()):
+            if hasattr(o, name):
+                stack.append(getattr(o, name))
+    return size
+
+
+class _Flight(object):
+    """a load in progress, the other threads wait() for its result."""
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = self.error = None
+        # set when the key changes meanwhile, the value is not stored then
+        self.cancelled = False
+
+    def done(self, value=None, error=None):
+        self.value = value
+        self.error = error
+        self.event.set()
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(filename, entries, chunk_size=1000, compresslevel=6):
+    """write the (key, value, deadline) entries into filename in the
+    save_pgz() format: a header dict, then lists of chunk_size entries.
+    Each list is saved already pickled, as a string: loading it back is one
+    big read instead of the many small ones of pickle.load() on a GzipFile.
+
+    The file is written aside and renamed, so a crash never leaves half a
+    snapshot behind. Return the number of entries written.
+    """
+    count = [0]
+
+    def objs():
+        yield {'version': SNAPSHOT_VERSION}
+        chunk = []
+        for entry in entries:
+            chunk.append(entry)
+            if len(chunk) == chunk_size:
+                count[0] += len(chunk)
+                yield pickle.dumps(chunk, 2)
+                chunk = []
+        if chunk:
+            count[0] += len(chunk)
+            yield pickle.dumps(chunk, 2)
+
+    tmp = filename + '.tmp'
+    save_pgz_iter(tmp, objs(), compresslevel)
+    os.rename(tmp, filename)
+    return count[0]
+
+
+def load_snapshot(filename):
+    """yield the (key, value, deadline) entries of a snapshot, one chunk
+    in memory at a time."""
+    objs = load_pgz(filename)
+    header = next(objs, None)
+    if not isinstance(header, dict) or \
+            header.get('version') != SNAPSHOT_VERSION:
+        raise ValueError('%s is not a cache snapshot' % filename)
+    for chunk in objs:
+        for entry in pickle.loads(chunk):
+            yield entry
+
+
+def restore_snapshot(cache, filename, now):
+    """set the live entries of a snapshot into cache, return how many."""
+    n = 0
+    for key, value, deadline in load_snapshot(filename):
+        if deadline is None:
+            cache.set(key, value)
+        elif deadline > now:
+            cache.set(key, value, deadline - now)
+        else:
+            continue
+        n += 1
+    return n
+
+
+def default_weigher(key, value):
+    """weigh an entry by the deep size of its value."""
+    return deep_sizeof(value)
+
 
 class FIFOCache(object, UserDict.DictMixin):
     """A map that can remember the items set.
 
+    The keys are kept in a doubly linked list threaded through a dict (a
+    linked hash map), so get, set, delete and eviction are all O(1).
+
+    Entries can also expire: ttl is the default time to live in seconds and
+    set() takes one per entry. An expired entry is dropped lazily when it is
+    accessed. The others are swept through a TimingWheel, at most
+    sweep_batch of them per set(), so lots of keys expiring together never
+    stall a single call. len() may count expired entries not swept yet.
+
+    The size can also be bounded by weight: weigher(key, value) weighs each
+    entry (default_weigher by default) and the oldest entries are evicted
+    until the total, the weight attribute, is back under max_weight.
+    num_entries may be None to bound the cache by weight only.
+
+    spill is an optional second tier, such as a db.mmapstore.MmapStore:
+    the entries evicted for room are written there instead of dropped, and
+    a miss that finds the key there moves it back. `in` looks at both
+    tiers, len() and keys() only at the memory one. Spilled entries keep
+    their deadline, expire() drops the expired ones from the spill too.
+
+    get_or_load(key, loader) fills misses from loader(key). Concurrent
+    misses on a key call loader once, the others wait for its result. A hit
+    less than refresh_ahead seconds before expiring is served stale while
+    one of at most refresh_workers background threads reloads it. They only
+    call loader, the new value is stored by the next call on the cache, in
+    the caller's thread, unless the key was set, deleted or evicted
+    meanwhile. get_or_load calls are synchronized with each other but not
+    with plain item access, share a ShardedLRUCache between threads for
+    that.
+
+    get_many(keys, loader) looks up many keys in one call and hands all the
+    misses to loader(keys) at once, which returns a dict of what it found.
+
+    snapshot(filename) saves the entries, their order and deadlines, and
+    restore(filename) loads them back, e.g. to start warm after a restart.
+    Deadlines are timer() values, so they survive a restart with time.time.
+
     Example:
     >>> f = FIFOCache(num_entries=3)
     >>> f['wish'] = 'fly'
@@ -99,6 +482,932 @@ class FIFOCache(object, UserDict.DictMixin):
     >>> f['height'] = '170cm'
     >>> f.keys()
     ['name', 'age', 'height']
+    >>> f['name'] = 'paul'
+    >>> f.keys()
+    ['age', 'height', 'name']
+    >>> f.popitem()
+    ('age', '3')
+    >>> now = [0]
+    >>> f = FIFOCache(10, ttl=60, timer=lambda: now[0])
+    >>> f['a'] = 1
+    >>> f.set('b', 2, ttl=5)
+    >>> now[0] = 10
+    >>> 'b' in f, f['a']
+    (False, 1)
+    >>> now[0] = 61
+    >>> f.get('a') is None
+    True
+    >>> t = [0]
+    >>> f = FIFOCache(2, timer=lambda: t[0])
+    >>> f['a'] = 1
+    >>> f.set('b', 2, ttl=0.2)
+    >>> t[0] = 0.5
+    >>> f['c'] = 3
+    >>> f.keys()
+    ['a', 'c']
+    >>> f.set('d', 4, ttl=0.2)
+    >>> t[0] = 0.8
+    >>> del f['d']
+    Traceback (most recent call last):
+        ...
+    KeyError: 'd'
+    >>> f = FIFOCache(None, max_weight=10, weigher=lambda k, v: len(v))
+    >>> f['a'] = 'xxxx'
+    >>> f['b'] = 'yyyy'
+    >>> f['c'] = 'zzzz'
+    >>> f.keys(), f.weight
+    (['b', 'c'], 8)
+    >>> f = LRUCache(2, spill={})
+    >>> f['a'], f['b'], f['c'] = 1, 2, 3
+    >>> f.keys(), f.spill.keys()
+    (['b', 'c'], ['a'])
+    >>> f['a'], f.keys()
+    (1, ['c', 'a'])
+    >>> t = [0]
+    >>> f = LRUCache(1, ttl=5, spill={}, timer=lambda: t[0])
+    >>> f['a'], f['b'] = 1, 2
+    >>> f.spill['a']
+    (5, 1)
+    >>> t[0] = 10
+    >>> 'a' in f, f.get('a'), f.spill
+    (False, None, {})
+    >>> f = FIFOCache(10, ttl=10, refresh_ahead=2, timer=lambda: now[0])
+    >>> f.get_or_load('x', lambda k: 1)
+    1
+    >>> now[0] = 70
+    >>> f.get_or_load('x', lambda k: 2)
+    1
+    >>> while 'x' in f._loading:
+    ...     time.sleep(0.01)
+    >>> f['x']
+    2
+    >>> f = LRUCache(10)
+    >>> f.set_many({'a': 1, 'b': 2})
+    >>> r = f.get_many(['a', 'b', 'c', 'd'],
+    ...                lambda keys: dict((k, k * 2) for k in keys))
+    >>> sorted(r.items())
+    [('a', 1), ('b', 2), ('c', 'cc'), ('d', 'dd')]
+    >>> import tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'cache.pgz')
+    >>> f.snapshot(filename)
+    4
+    >>> g = LRUCache(10)
+    >>> g.restore(filename)
+    4
+    >>> g.keys() == f.keys()
+    True
+    """
+    # the tick of the wheel sweeping expired entries, in seconds
+    ttl_tick = 1.0
+    # how many expired entries a set() may sweep
+    sweep_batch = 16
+    # whether a hit makes the entry the newest one
+    move_on_hit = False
+    # how many threads may refresh entries ahead of their expiry
+    refresh_workers = 2
+
+    def __init__(self, num_entries, d=(), ttl=None, timer=time.time,
+                 max_weight=None, weigher=None, spill=None,
+                 refresh_ahead=None):
+        self.num_entries = num_entries
+        self.spill = spill
+        self.ttl = ttl
+        self.timer = timer
+        self.refresh_ahead = refresh_ahead
+        self._lock = threading.RLock()
+        # key -> _Flight of the loads in progress
+        self._loading = {}
+        # the refreshes to do, and the ones done, key -> (value, ttl,
+        # flight), that the next call stores
+        self._refreshes = collections.deque()
+        self._refreshed = {}
+        self._refreshers = 0
+        self.max_weight = max_weight
+        if weigher is None and max_weight is not None:
+            weigher = default_weigher
+        self.weigher = weigher
+        self.weight = 0
+        # created on the first entry with a ttl, and on the first spilled
+        # entry with a deadline
+        self.wheel = self.spill_wheel = None
+        self.d = {}
+        # the root of the circular list, root[NEXT] is the oldest link
+        self.root = root = []
+        root[:] = [root, root, None, None]
+        self.update(d)
+
+    def __repr__(self):
+        return '%s(%r, %r)' % (self.__class__.__name__,
+                               self.num_entries, dict(self.iteritems()))
+
+    def copy(self):
+        c = self.__class__(self.num_entries, ttl=self.ttl, timer=self.timer,
+                           max_weight=self.max_weight, weigher=self.weigher,
+                           refresh_ahead=self.refresh_ahead)
+        now = self.timer()
+        wheel = self.wheel
+        for link in self._links():
+            deadline = wheel.deadline(link[KEY]) if wheel else None
+            c.set(link[KEY], link[VALUE],
+                  None if deadline is None else deadline - now)
+        return c
+
+    def _unlink(self, link):
+        link_prev, link_next = link[PREV], link[NEXT]
+        link_prev[NEXT] = link_next
+        link_next[PREV] = link_prev
+
+    def _append(self, link):
+        root = self.root
+        last = root[PREV]
+        link[PREV] = last
+        link[NEXT] = root
+        last[NEXT] = root[PREV] = link
+
+    def _forget(self, link):
+        self._unlink(link)
+        if self.weigher is not None:
+            self.weight -= link[WEIGHT]
+
+    def _remove(self, link):
+        """drop link and everything we know about its key."""
+        self._forget(link)
+        del self.d[link[KEY]]
+        if self.wheel is not None:
+            self.wheel.cancel(link[KEY])
+        if self._loading or self._refreshed:
+            self._cancel_load(link[KEY])
+
+    def _cancel_load(self, key):
+        """keep a load of key in progress from storing its value."""
+        # a refresh moves from _loading to _refreshed, in that order, so
+        # looking in _loading first always finds it in one of them
+        flight = self._loading.get(key)
+        if flight is not None:
+            flight.cancelled = True
+        self._refreshed.pop(key, None)
+
+    def _evict(self):
+        link = self.root[NEXT]
+        key = link[KEY]
+        # _remove() cancels the timer, read the deadline first
+        deadline = self.wheel.deadline(key) if self.wheel else None
+        self._remove(link)
+        if self.spill is not None:
+            self.spill[key] = deadline, link[VALUE]
+            if deadline is not None:
+                if self.spill_wheel is None:
+                    self.spill_wheel = TimingWheel(self.ttl_tick,
+                                                   now=self.timer())
+                self.spill_wheel.schedule(key, deadline)
+
+    def _drop_expired(self):
+        """drop an expired entry not swept yet, return whether there was
+        one. Evicting a live entry instead would leave the dead one its
+        room."""
+        wheel = self.wheel
+        expired = wheel.expired(1)
+        if not expired:
+            # the ones due within the current tick
+            wheel.flush(self.timer())
+            expired = wheel.expired(1)
+            if not expired:
+                return False
+        self._forget(self.d.pop(expired[0][0]))
+        return True
+
+    def _unspill(self, key):
+        """drop key from the spill, return its (deadline, value)."""
+        if self.spill_wheel is not None:
+            self.spill_wheel.cancel(key)
+        return self.spill.pop(key)
+
+    def _spilled(self, key):
+        """whether key is in the spill and not expired, drop it if it is."""
+        if self.spill is None or key not in self.spill:
+            return False
+        deadline = self.spill[key][0]
+        if deadline is not None and deadline <= self.timer():
+            self._unspill(key)
+            return False
+        return True
+
+    def _promote(self, key):
+        """move key back from the spill, raise KeyError if it is not there."""
+        if self.spill is None or key not in self.spill:
+            raise KeyError(key)
+        deadline, value = self._unspill(key)
+        ttl = None
+        if deadline is not None:
+            ttl = deadline - self.timer()
+            if ttl <= 0:
+                raise KeyError(key)
+        self.set(key, value, ttl)
+        return value
+
+    def _expired(self, key):
+        """drop key if it has expired, return whether it had."""
+        deadline = self.wheel.deadline(key)
+        if deadline is None or deadline > self.timer():
+            return False
+        self._remove(self.d[key])
+        return True
+
+    def _apply_refreshes(self):
+        """store the values reloaded in the background."""
+        refreshed = self._refreshed
+        while refreshed:
+            key, (value, ttl, flight) = refreshed.popitem()
+            if flight.cancelled or key not in self.d:
+                continue
+            if self.wheel is not None and self._expired(key):
+                continue
+            self._set(key, value, ttl)
+
+    def _links(self):
+        """the links from oldest to newest, skipping the expired ones."""
+        if self._refreshed:
+            self._apply_refreshes()
+        root = self.root
+        link = root[NEXT]
+        wheel = self.wheel
+        if wheel:
+            now = self.timer()
+        while link is not root:
+            if wheel:
+                deadline = wheel.deadline(link[KEY])
+                if deadline is not None and deadline <= now:
+                    link = link[NEXT]
+                    continue
+            yield link
+            link = link[NEXT]
+
+    # walk the links directly, so iterating never counts as a hit in
+    # LRUCache (which would reorder the list under our feet).
+    def __iter__(self):
+        for link in self._links():
+            yield link[KEY]
+
+    iterkeys = __iter__
+
+    def iteritems(self):
+        for link in self._links():
+            yield link[KEY], link[VALUE]
+
+    def itervalues(self):
+        for link in self._links():
+            yield link[VALUE]
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def __len__(self):
+        return len(self.d)
+
+    def __getitem__(self, key):
+        if self._refreshed:
+            self._apply_refreshes()
+        link = self.d.get(key)
+        if link is None:
+            return self._promote(key)
+        if self.wheel is not None and self._expired(key):
+            raise KeyError(key)
+        return link[VALUE]
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key, value, ttl=None):
+        """set key to value, it expires in ttl seconds (default self.ttl)."""
+        if self._refreshed:
+            self._apply_refreshes()
+        self._set(key, value, ttl)
+
+    def _set(self, key, value, ttl):
+        if self.wheel is not None:
+            self.expire(self.sweep_batch)
+        if self._loading or self._refreshed:
+            self._cancel_load(key)
+        d = self.d
+        link = d.get(key)
+        if link is None:
+            d[key] = link = [None, None, key, value]
+            if self.weigher is not None:
+                link.append(0)
+            if self.spill is not None and key in self.spill:
+                self._unspill(key)
+        else:
+            self._unlink(link)
+            link[VALUE] = value
+        self._append(link)
+        if self.weigher is not None:
+            weight = self.weigher(key, value)
+            self.weight += weight - link[WEIGHT]
+            link[WEIGHT] = weight
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is not None:
+            now = self.timer()
+            if self.wheel is None:
+                self.wheel = TimingWheel(self.ttl_tick, now=now)
+            self.wheel.schedule(key, now + ttl)
+        elif self.wheel is not None:
+            self.wheel.cancel(key)
+        if self.num_entries is not None and len(d) > self.num_entries:
+            if self.wheel is None or not self._drop_expired():
+                self._evict()
+        if self.max_weight is not None:
+            # an entry heavier than max_weight evicts everything, itself too
+            while self.weight > self.max_weight:
+                if self.wheel is None or not self._drop_expired():
+                    self._evict()
+
+    def get_many(self, keys, loader=None, ttl=None):
+        """return a dict of the keys found, loading the misses at once."""
+        if self._refreshed:
+            self._apply_refreshes()
+        found = {}
+        missing = []
+        d = self.d
+        wheel = self.wheel
+        move = self.move_on_hit
+        for key in keys:
+            link = d.get(key)
+            if link is not None and (wheel is None or not self._expired(key)):
+                if move:
+                    self._unlink(link)
+                    self._append(link)
+                found[key] = link[VALUE]
+            elif key not in found:
+                try:
+                    found[key] = self._promote(key)
+                except KeyError:
+                    missing.append(key)
+        if missing and loader is not None:
+            loaded = loader(list(set(missing)))
+            self.set_many(loaded, ttl)
+            found.update(loaded)
+        return found
+
+    def set_many(self, items, ttl=None):
+        """set all the (key, value) pairs of items, a dict or a sequence."""
+        if hasattr(items, 'iteritems'):
+            items = items.iteritems()
+        for key, value in items:
+            self.set(key, value, ttl)
+
+    def _entries(self):
+        """(key, value, deadline) of the live entries, oldest first."""
+        wheel = self.wheel
+        for link in self._links():
+            deadline = wheel.deadline(link[KEY]) if wheel else None
+            yield link[KEY], link[VALUE], deadline
+
+    def snapshot(self, filename, chunk_size=1000):
+        """save the entries into filename, return how many."""
+        with self._lock:
+            return save_snapshot(filename, self._entries(), chunk_size)
+
+    def restore(self, filename):
+        """set the entries saved by snapshot(), return how many."""
+        with self._lock:
+            return restore_snapshot(self, filename, self.timer())
+
+    def get_or_load(self, key, loader, ttl=None):
+        """return self[key], filling a miss with loader(key)."""
+        with self._lock:
+            try:
+                value = self[key]
+            except KeyError:
+                flight = self._loading.get(key)
+                if flight is None:
+                    flight = self._loading[key] = _Flight()
+                    leader = True
+                else:
+                    leader = False
+            else:
+                if self._stale(key):
+                    flight = self._loading[key] = _Flight()
+                    self._refreshes.append((key, loader, ttl, flight))
+                    if self._refreshers < self.refresh_workers:
+                        self._refreshers += 1
+                        refresher = threading.Thread(target=self._refresh)
+                        refresher.daemon = True
+                        refresher.start()
+                return value
+        if leader:
+            return self._load(key, loader, ttl, flight)
+        return flight.wait()
+
+    def _stale(self, key):
+        """whether key should be refreshed ahead of its expiry."""
+        if self.refresh_ahead is None or not self.wheel:
+            return False
+        if key in self._loading:
+            return False
+        deadline = self.wheel.deadline(key)
+        return (deadline is not None and
+                deadline - self.timer() < self.refresh_ahead)
+
+    def _load(self, key, loader, ttl, flight):
+        try:
+            value = loader(key)
+        except Exception as e:
+            with self._lock:
+                del self._loading[key]
+            flight.done(error=e)
+            raise
+        with self._lock:
+            if not flight.cancelled:
+                self.set(key, value, ttl)
+            del self._loading[key]
+        flight.done(value)
+        return value
+
+    def _refresh(self):
+        """reload the keys queued by get_or_load, until there are none.
+
+        The values go to _refreshed, not into the cache: the callers of the
+        cache, which may not lock it, store them.
+        """
+        while True:
+            with self._lock:
+                if not self._refreshes:
+                    self._refreshers -= 1
+                    return
+                key, loader, ttl, flight = self._refreshes.popleft()
+            try:
+                value = loader(key)
+            except Exception as e:
+                # keep serving the old value, the next hit tries again
+                with self._lock:
+                    del self._loading[key]
+                flight.done(error=e)
+                continue
+            with self._lock:
+                self._refreshed[key] = value, ttl, flight
+                del self._loading[key]
+            flight.done(value)
+
+    def __delitem__(self, key):
+        if self._refreshed:
+            self._apply_refreshes()
+        link = self.d.get(key)
+        if link is not None:
+            if self.wheel is not None and self._expired(key):
+                raise KeyError(key)
+            self._remove(link)
+        elif self._spilled(key):
+            self._unspill(key)
+        else:
+            raise KeyError(key)
+
+    def expire(self, limit=None):
+        """drop up to limit expired entries, return how many were dropped."""
+        if self._refreshed:
+            self._apply_refreshes()
+        wheel = self.wheel
+        if wheel is None:
+            return 0
+        now = self.timer()
+        wheel.advance(now)
+        expired = wheel.expired(limit)
+        d = self.d
+        for key, deadline in expired:
+            self._forget(d.pop(key))
+        n = len(expired)
+        spill_wheel = self.spill_wheel
+        if spill_wheel is not None and (limit is None or n < limit):
+            spill_wheel.advance(now)
+            expired = spill_wheel.expired(None if limit is None
+                                          else limit - n)
+            spill = self.spill
+            for key, deadline in expired:
+                del spill[key]
+            n += len(expired)
+        return n
+
+    def popitem(self):
+        """remove and return the oldest (key, value) pair."""
+        for link in self._links():
+            self._remove(link)
+            return link[KEY], link[VALUE]
+        raise KeyError('popitem(): cache is empty')
+
+    def clear(self):
+        for flight in self._loading.values():
+            flight.cancelled = True
+        self._refreshed.clear()
+        self.d.clear()
+        self.wheel = self.spill_wheel = None
+        self.weight = 0
+        if self.spill is not None:
+            self.spill.clear()
+        root = self.root
+        root[:] = [root, root, None, None]
+
+    def __contains__(self, key):
+        if self._refreshed:
+            self._apply_refreshes()
+        if key not in self.d:
+            return self._spilled(key)
+        return self.wheel is None or not self._expired(key)
+    has_key = __contains__
+
+
+class LRUCache(FIFOCache):
+    """Least Recently Used Cache.
+
+    Example:
+    >>> c = LRUCache(num_entries=2)
+    >>> c['a'] = 1
+    >>> c['b'] = 2
+    >>> c['a']
+    1
+    >>> c['c'] = 3
+    >>> c.keys()
+    ['a', 'c']
+    """
+    move_on_hit = True
+
+    def __getitem__(self, key):
+        if self._refreshed:
+            self._apply_refreshes()
+        link = self.d.get(key)
+        if link is None:
+            return self._promote(key)
+        if self.wheel is not None and self._expired(key):
+            raise KeyError(key)
+        self._unlink(link)
+        self._append(link)
+        return link[VALUE]
+
+
+class ShardedLRUCache(object, UserDict.DictMixin):
+    """A thread-safe LRUCache split into shards, each with its own lock.
+
+    A key lives in shard hash(key) % shards, so threads touching different
+    keys seldom wait for each other, where wrapping one LRUCache in a
+    SynchronizedObject puts every call behind the same RLock. The shards
+    split num_entries between them, which must be at least shards, and
+    each keeps max_weight // shards weight. The eviction is LRU per shard:
+    keys do not spread evenly, so a shard may evict while the cache holds
+    fewer than num_entries entries. The other keyword arguments (ttl,
+    timer, weigher, refresh_ahead) are passed to the shards.
+
+    Example:
+    >>> c = ShardedLRUCache(64, shards=4)
+    >>> for i in range(100):
+    ...     c[i] = i
+    >>> len(c)
+    64
+    >>> c[99], 0 in c
+    (99, False)
+    >>> sum(shard.num_entries for shard in ShardedLRUCache(100).shards)
+    100
+    >>> r = c.get_many((k for k in [98, 99, 100]),
+    ...                lambda keys: dict((k, -k) for k in keys))
+    >>> sorted(r.items())
+    [(98, 98), (99, 99), (100, -100)]
+    """
+    def __init__(self, num_entries, d=(), shards=16, **kwargs):
+        self.num_entries = num_entries
+        sizes = [None] * shards
+        if num_entries is not None:
+            if num_entries < shards:
+                raise ValueError('%d entries cannot fill %d shards'
+                                 % (num_entries, shards))
+            # the first num_entries % shards shards take one more
+            sizes = [num_entries // shards + (i < num_entries % shards)
+                     for i in range(shards)]
+        if kwargs.get('max_weight') is not None:
+            kwargs['max_weight'] = max(1, kwargs['max_weight'] // shards)
+        self.shards = [LRUCache(size, **kwargs) for size in sizes]
+        # the same lock get_or_load() of the shard takes
+        self.locks = [shard._lock for shard in self.shards]
+        self.update(d)
+
+    def __repr__(self):
+        return '%s(%r, %r)' % (self.__class__.__name__,
+                               self.num_entries, dict(self.iteritems()))
+
+    def _shard(self, key):
+        return hash(key) % len(self.shards)
+
+    def __getitem__(self, key):
+        i = self._shard(key)
+        with self.locks[i]:
+            return self.shards[i][key]
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key, value, ttl=None):
+        """set key to value, it expires in ttl seconds (default ttl)."""
+        i = self._shard(key)
+        with self.locks[i]:
+            self.shards[i].set(key, value, ttl)
+
+    def get_or_load(self, key, loader, ttl=None):
+        """return self[key], filling a miss with loader(key)."""
+        return self.shards[self._shard(key)].get_or_load(key, loader, ttl)
+
+    def _entries(self):
+        for lock, shard in zip(self.locks, self.shards):
+            with lock:
+                entries = list(shard._entries())
+            for entry in entries:
+                yield entry
+
+    def snapshot(self, filename, chunk_size=1000):
+        """save the entries into filename, return how many."""
+        return save_snapshot(filename, self._entries(), chunk_size)
+
+    def restore(self, filename):
+        """set the entries saved by snapshot(), return how many."""
+        return restore_snapshot(self, filename, self.shards[0].timer())
+
+    def _by_shard(self, keys):
+        groups = {}
+        for key in keys:
+            groups.setdefault(self._shard(key), []).append(key)
+        return groups.iteritems()
+
+    def get_many(self, keys, loader=None, ttl=None):
+        """return a dict of the keys found, loading the misses at once."""
+        # keys may be an iterator, and we go over it twice
+        keys = list(keys)
+        found = {}
+        for i, shard_keys in self._by_shard(keys):
+            with self.locks[i]:
+                found.update(self.shards[i].get_many(shard_keys))
+        if loader is not None:
+            missing = [key for key in set(keys) if key not in found]
+            if missing:
+                loaded = loader(missing)
+                self.set_many(loaded, ttl)
+                found.update(loaded)
+        return found
+
+    def set_many(self, items, ttl=None):
+        """set all the (key, value) pairs of items, a dict or a sequence."""
+        items = dict(items)
+        for i, shard_keys in self._by_shard(items):
+            with self.locks[i]:
+                self.shards[i].set_many([(k, items[k]) for k in shard_keys],
+                                        ttl)
+
+    def __delitem__(self, key):
+        i = self._shard(key)
+        with self.locks[i]:
+            del self.shards[i][key]
+
+    def __contains__(self, key):
+        i = self._shard(key)
+        with self.locks[i]:
+            return key in self.shards[i]
+    has_key = __contains__
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    @property
+    def weight(self):
+        return sum(shard.weight for shard in self.shards)
+
+    def iteritems(self):
+        # a snapshot of one shard at a time
+        for lock, shard in zip(self.locks, self.shards):
+            with lock:
+                items = shard.items()
+            for item in items:
+                yield item
+
+    def __iter__(self):
+        for k, v in self.iteritems():
+            yield k
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
+    def clear(self):
+        for lock, shard in zip(self.locks, self.shards):
+            with lock:
+                shard.clear()
+
+    def expire(self, limit=None):
+        """drop up to limit expired entries per shard."""
+        n = 0
+        for lock, shard in zip(self.locks, self.shards):
+            with lock:
+                n += shard.expire(limit)
+        return n
+
+
+class CountMinSketch(object):
+    """A count-min sketch of 4 bit counters that ages by halving them.
+
+    frequency(key) estimates how many times key was added, it never
+    underestimates but for the counters saturating at 15. After
+    sample_size adds all the counters are halved, so old popularity
+    fades away.
+
+    Example:
+    >>> s = CountMinSketch(16)
+    >>> for i in range(3):
+    ...     s.add('a')
+    >>> s.frequency('a'), s.frequency('b')
+    (3, 0)
+    """
+    seeds = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F,
+             0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+
+    def __init__(self, num_entries, sample_factor=10):
+        # 4 counters per entry and row, like the 16 per entry of Caffeine
+        bits = 2
+        while 1 << bits < num_entries * 4:
+            bits += 1
+        self.shift = 64 - bits
+        self.rows = [bytearray(1 << bits) for seed in self.seeds]
+        self.sample_size = sample_factor * max(1, num_entries)
+        self.additions = 0
+
+    def _indexes(self, key):
+        # multiplicative hashing, the index is the top bits of the product
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        shift = self.shift
+        return [((h * seed) & 0xFFFFFFFFFFFFFFFF) >> shift
+                for seed in self.seeds]
+
+    def frequency(self, key):
+        return min([row[i] for row, i in zip(self.rows, self._indexes(key))])
+
+    def add(self, key):
+        added = False
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        shift = self.shift
+        for row, seed in zip(self.rows, self.seeds):
+            i = ((h * seed) & 0xFFFFFFFFFFFFFFFF) >> shift
+            if row[i] < 15:
+                row[i] += 1
+                added = True
+        if added:
+            self.additions += 1
+            if self.additions >= self.sample_size:
+                self.reset()
+
+    def reset(self):
+        """halve all the counters."""
+        for row in self.rows:
+            row[:] = bytearray([c >> 1 for c in row])
+        self.additions //= 2
+
+
+class TinyLFUCache(object, UserDict.DictMixin):
+    """A scan resistant cache, the W-TinyLFU policy of Caffeine.
+
+    New keys enter a small LRU window, 1% of num_entries. A key evicted from
+    the window only gets into the main cache if a CountMinSketch of the
+    recent hits and sets says it is used more often than the entry it would
+    evict, so a scan over keys used once can not flush the hot ones. The main
+    cache is a segmented LRU: a hit in probation moves the key to protected,
+    which holds up to 80% of it.
+
+    Example:
+    >>> c = TinyLFUCache(100)
+    >>> for n in range(5):
+    ...     for i in range(50):
+    ...         c[i] = i
+    >>> for i in range(1000, 1500):
+    ...     c[i] = i
+    >>> len([i for i in range(50) if i in c])
+    50
+    """
+    def __init__(self, num_entries, d=()):
+        self.num_entries = num_entries
+        self.window_size = max(1, num_entries // 100)
+        self.main_size = num_entries - self.window_size
+        self.protected_size = int(self.main_size * 0.8)
+        self.sketch = CountMinSketch(num_entries)
+        self.window = LRUCache(None)
+        self.probation = LRUCache(None)
+        self.protected = LRUCache(None)
+        self.update(d)
+
+    def __repr__(self):
+        return '%s(%r, %r)' % (self.__class__.__name__,
+                               self.num_entries, dict(self.iteritems()))
+
+    def copy(self):
+        return self.__class__(self.num_entries, self.iteritems())
+
+    def _segment(self, key):
+        # most hits are in protected
+        if key in self.protected.d:
+            return self.protected
+        if key in self.probation.d:
+            return self.probation
+        if key in self.window.d:
+            return self.window
+        return None
+
+    def _protect(self, key, value):
+        protected = self.protected
+        protected[key] = value
+        if len(protected) > self.protected_size:
+            k, v = protected.popitem()
+            self.probation[k] = v
+
+    def _admit(self, key, value):
+        probation = self.probation
+        if len(probation) + len(self.protected) < self.main_size:
+            probation[key] = value
+            return
+        if not probation:
+            return
+        victim = probation.root[NEXT][KEY]
+        sketch = self.sketch
+        if sketch.frequency(key) > sketch.frequency(victim):
+            del probation[victim]
+            probation[key] = value
+
+    def __getitem__(self, key):
+        segment = self._segment(key)
+        if segment is None:
+            raise KeyError(key)
+        self.sketch.add(key)
+        value = segment[key]
+        if segment is self.probation:
+            del segment[key]
+            self._protect(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        self.sketch.add(key)
+        segment = self._segment(key)
+        if segment is self.probation:
+            del segment[key]
+            self._protect(key, value)
+        elif segment is not None:
+            segment[key] = value
+        else:
+            window = self.window
+            window[key] = value
+            if len(window) > self.window_size:
+                self._admit(*window.popitem())
+
+    def __delitem__(self, key):
+        segment = self._segment(key)
+        if segment is None:
+            raise KeyError(key)
+        del segment[key]
+
+    def __contains__(self, key):
+        return self._segment(key) is not None
+    has_key = __contains__
+
+    def __len__(self):
+        return len(self.window) + len(self.probation) + len(self.protected)
+
+    def iteritems(self):
+        for segment in (self.window, self.probation, self.protected):
+            for item in segment.iteritems():
+                yield item
+
+    def __iter__(self):
+        for k, v in self.iteritems():
+            yield k
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
+    def clear(self):
+        for segment in (self.window, self.probation, self.protected):
+            segment.clear()
+
+
+class FIFOListCache(object, UserDict.DictMixin):
+    """Same as FIFOCache, but the order is kept in a list, which makes every
+    overwrite cost O(n).
+
+    Example:
+    >>> f = FIFOListCache(num_entries=3)
+    >>> f['wish'] = 'fly'
+    >>> f['name'] = 'peter'
+    >>> f['age'] = '3'
+    >>> f['height'] = '170cm'
+    >>> f.keys()
+    ['name', 'age', 'height']
     """
     def __init__(self, num_entries, d=()):
         self.num_entries = num_entries
@@ -137,8 +1446,8 @@ class FIFOCache(object, UserDict.DictMixin):
     has_key = __contains__
 
 
-class LRUCache(FIFOCache):
-    """Least Recently Used Cache."""
+class LRUListCache(FIFOListCache):
+    """Same as LRUCache, but every hit costs O(n)."""
     def __getitem__(self, key):
         if key in self.d:
             self.l.remove(key)
@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the structures in ds/fifo.py.
+
+Usage: python -m snippetpy.ds.fifo_bench [name ...]
+Run without names to run all of them. The names go to stderr, so the output
+of `fifos`, which is JSON, can be redirected to a file.
+"""
+from __future__ import print_function
+
+import bisect
+import json
+import os
+import Queue
+import random
+import sys
+import tempfile
+import threading
+from timeit import default_timer
+
+from snippetpy.concurrence.synchronized import SynchronizedObject
+from snippetpy.ds.fifo import (FIFO, FIFOList, FIFODict, FIFODeque,
+                               FIFOArray, BlockingFIFO, FIFOCache, LRUCache,
+                               FIFOListCache, LRUListCache, ShardedLRUCache,
+                               TinyLFUCache, deep_sizeof)
+
+
+def _ops_per_sec(func, *args):
+    """call func(*args), which returns the number of ops it did."""
+    start = default_timer()
+    n = func(*args)
+    elapsed = default_timer() - start
+    return n / elapsed if elapsed else float('inf')
+
+
+def _fill(cache, size):
+    for i in range(size):
+        cache[i] = i
+    return cache
+
+
+def _hits(cache, keys):
+    for k in keys:
+        cache[k]
+    return len(keys)
+
+
+def _overwrites(cache, keys):
+    for k in keys:
+        cache[k] = k
+    return len(keys)
+
+
+def bench_caches(sizes=(1000, 100000, 1000000)):
+    """LRU hits and FIFO overwrites, linked hash map vs list.
+
+    The list-based caches cost O(n) per op, so they get fewer ops at the
+    larger sizes, we report ops/sec anyway.
+    """
+    print('%-14s %10s %12s %14s' % ('cache', 'size', 'op', 'ops/sec'))
+    for size in sizes:
+        for cls, op in ((LRUCache, _hits), (LRUListCache, _hits),
+                        (FIFOCache, _overwrites),
+                        (FIFOListCache, _overwrites)):
+            if cls in (LRUListCache, FIFOListCache):
+                nops = max(10, min(100000, 10 ** 8 // size))
+            else:
+                nops = 100000
+            cache = _fill(cls(size), size)
+            keys = [random.randrange(size) for i in range(nops)]
+            print('%-14s %10d %12s %14.0f' % (cls.__name__, size,
+                                              op.__name__.strip('_'),
+                                              _ops_per_sec(op, cache, keys)))
+
+
+def _worker(cache, keys, nsets):
+    get = cache.get
+    for k in keys[:nsets]:
+        cache.set(k, k)
+    for k in keys[nsets:]:
+        get(k)
+
+
+def bench_contention(threads=(1, 2, 4, 8, 16), size=100000, nops=200000):
+    """Threads doing 90% gets and 10% sets on one shared cache.
+
+    A SynchronizedObject-wrapped LRUCache takes one RLock for every call,
+    the ShardedLRUCache one lock per shard.
+    """
+    print('%-22s %8s %14s' % ('cache', 'threads', 'ops/sec'))
+    for nthreads in threads:
+        for name, make in (
+                ('SynchronizedObject', lambda: SynchronizedObject(
+                    _fill(LRUCache(size), size))),
+                ('ShardedLRUCache', lambda: _fill(ShardedLRUCache(size),
+                                                  size))):
+            cache = make()
+            per_thread = nops // nthreads
+            workers = []
+            for i in range(nthreads):
+                keys = [random.randrange(size * 2) for j in range(per_thread)]
+                workers.append(threading.Thread(
+                    target=_worker, args=(cache, keys, per_thread // 10)))
+            start = default_timer()
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            elapsed = default_timer() - start
+            print('%-22s %8d %14.0f' % (name, nthreads,
+                                        per_thread * nthreads / elapsed))
+
+
+def zipf_trace(n, nkeys, s=1.0, seed=1):
+    """n keys drawn from range(nkeys) with a Zipf(s) popularity."""
+    rnd = random.Random(seed)
+    cdf = []
+    total = 0.0
+    for i in range(nkeys):
+        total += 1.0 / (i + 1) ** s
+        cdf.append(total)
+    # shuffle the ranks, so the popular keys are not the small integers
+    keys = list(range(nkeys))
+    rnd.shuffle(keys)
+    return [keys[bisect.bisect(cdf, rnd.random() * total)] for i in range(n)]
+
+
+def scan_trace(trace, scan_len, every, start=10 ** 9):
+    """insert a sequential scan of scan_len never seen keys every `every`
+    keys of trace, like a batch job walking a table."""
+    result = []
+    next_key = start
+    for i in range(0, len(trace), every):
+        result.extend(trace[i:i + every])
+        result.extend(range(next_key, next_key + scan_len))
+        next_key += scan_len
+    return result
+
+
+def replay(cache, trace):
+    """replay trace in a cache-aside way, return (hits, seconds)."""
+    hits = 0
+    start = default_timer()
+    for key in trace:
+        if key in cache:
+            cache[key]
+            hits += 1
+        else:
+            cache[key] = key
+    return hits, default_timer() - start
+
+
+def bench_policies(size=10000, n=500000, nkeys=200000):
+    """Hit ratio and ops/sec of LRU vs W-TinyLFU on replayed traces."""
+    zipf = zipf_trace(n, nkeys)
+    traces = (
+        ('zipf', zipf),
+        ('zipf+scan', scan_trace(zipf, size * 2, n // 10)),
+        ('loop', list(range(size * 3 // 2)) * (n // (size * 3 // 2))),
+    )
+    print('%-12s %-14s %10s %14s' % ('trace', 'cache', 'hit ratio',
+                                     'ops/sec'))
+    for name, trace in traces:
+        for cls in (LRUCache, TinyLFUCache):
+            hits, elapsed = replay(cls(size), trace)
+            print('%-12s %-14s %10.4f %14.0f' % (
+                name, cls.__name__, float(hits) / len(trace),
+                len(trace) / elapsed))
+
+
+def bench_batch(size=100000, batch=200, nbatches=2000, hit_ratio=0.9):
+    """Looking up batches of keys one [] at a time vs get_many().
+
+    Keys outside the cache cost a loader call each in the first case, one
+    loader call per batch with get_many().
+    """
+    calls = [0]
+
+    def load_one(key):
+        calls[0] += 1
+        return key
+
+    def load_many(keys):
+        calls[0] += 1
+        return dict((k, k) for k in keys)
+
+    batches = [[random.randrange(int(size / hit_ratio)) for i in range(batch)]
+               for j in range(nbatches)]
+    print('%-12s %14s %14s' % ('way', 'keys/sec', 'loader calls'))
+    for name in ('getitem', 'get_many'):
+        cache = _fill(LRUCache(size), size)
+        calls[0] = 0
+        start = default_timer()
+        for keys in batches:
+            if name == 'get_many':
+                cache.get_many(keys, load_many)
+                continue
+            result = {}
+            for k in keys:
+                try:
+                    result[k] = cache[k]
+                except KeyError:
+                    result[k] = cache[k] = load_one(k)
+        elapsed = default_timer() - start
+        print('%-12s %14.0f %14d' % (name, batch * nbatches / elapsed,
+                                     calls[0]))
+
+
+def bench_snapshot(sizes=(10000, 100000, 1000000)):
+    """Time and size of LRUCache.snapshot() and restore()."""
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, 'cache.pgz')
+    print('%10s %12s %12s %14s %14s' % ('entries', 'snapshot s', 'restore s',
+                                        'bytes', 'bytes/entry'))
+    for size in sizes:
+        cache = LRUCache(size)
+        for i in range(size):
+            cache['key:%d' % i] = {'id': i, 'name': 'name %d' % i}
+        start = default_timer()
+        cache.snapshot(filename)
+        saved = default_timer() - start
+        nbytes = os.path.getsize(filename)
+        start = default_timer()
+        LRUCache(size).restore(filename)
+        restored = default_timer() - start
+        print('%10d %12.2f %12.2f %14d %14.1f' % (
+            size, saved, restored, nbytes, float(nbytes) / size))
+    os.remove(filename)
+    os.rmdir(tmpdir)
+
+
+def _append_all(fifo, n):
+    append = fifo.append
+    for i in range(n):
+        append(i)
+    return n
+
+
+def _pop_all(fifo, n):
+    pop = fifo.pop
+    for i in range(n):
+        pop()
+    return n
+
+
+def _interleaved(fifo, n):
+    append = fifo.append
+    pop = fifo.pop
+    for i in range(n):
+        append(i)
+        pop()
+    return 2 * n
+
+
+def _burst(fifo, n, burst=1000):
+    append = fifo.append
+    pop = fifo.pop
+    for i in range(0, n, burst):
+        for j in range(burst):
+            append(j)
+        for j in range(burst):
+            pop()
+    return 2 * (n // burst * burst)
+
+
+def _bytes_per_element(cls, size):
+    """the bytes a FIFO of size elements adds to its elements, which are
+    all the same object here."""
+    fifo = cls()
+    x = object()
+    for i in range(size):
+        fifo.append(x)
+    return float(deep_sizeof(fifo) - deep_sizeof(x)) / size
+
+
+def bench_fifos(sizes=(1000, 100000, 1000000, 10000000), out=sys.stdout,
+                max_linear=100000, max_ops=1000000):
+    """Throughput and footprint of the FIFO variants, as JSON.
+
+    Patterns: append n elements, pop them, append+pop pairs on a queue
+    holding n elements, and bursts of 1000 appends then 1000 pops. The
+    variants whose pop() is O(n) (FIFOList) only run the pop patterns up
+    to max_linear elements, the others are reported as null. A pattern does
+    at most max_ops ops.
+    """
+    results = []
+    for size in sizes:
+        for cls in (FIFO, FIFOList, FIFODict, FIFODeque):
+            linear = cls is FIFOList
+            record = {'variant': cls.__name__, 'size': size}
+            nops = min(size, max_ops)
+            fifo = cls()
+            record['append'] = _ops_per_sec(_append_all, fifo, size)
+            if linear and size > max_linear:
+                record['pop'] = record['interleaved'] = record['burst'] = None
+            else:
+                record['pop'] = _ops_per_sec(_pop_all, fifo, nops)
+                fifo = cls()
+                _append_all(fifo, size)
+                record['interleaved'] = _ops_per_sec(_interleaved, fifo, nops)
+                record['burst'] = _ops_per_sec(_burst, cls(), nops)
+            del fifo
+            record['bytes_per_element'] = _bytes_per_element(cls, size)
+            results.append(record)
+    json.dump({'benchmark': 'fifos', 'python': sys.version.split()[0],
+               'unit': 'ops/sec', 'results': results}, out, indent=1,
+              sort_keys=True)
+    out.write('\n')
+    return results
+
+
+def bench_array_fifo(sizes=(100000, 1000000, 10000000)):
+    """Memory and throughput of FIFOArray('d') vs FIFODeque of floats."""
+    print('%-10s %10s %14s %16s %16s' % ('fifo', 'floats', 'bytes/float',
+                                         'append/sec', 'pop_many/sec'))
+    for size in sizes:
+        data = [random.random() for i in range(size)]
+        for cls in (FIFODeque, FIFOArray):
+            fifo = cls()
+            start = default_timer()
+            fifo.extend(data)
+            appended = size / (default_timer() - start)
+            nbytes = deep_sizeof(fifo)
+            start = default_timer()
+            if cls is FIFOArray:
+                while fifo:
+                    fifo.pop_many(1000)
+            else:
+                pop = fifo.pop
+                while fifo:
+                    [pop() for i in range(min(1000, len(fifo)))]
+            popped = size / (default_timer() - start)
+            print('%-10s %10d %14.1f %16.0f %16.0f' % (
+                cls.__name__, size, float(nbytes) / size, appended, popped))
+
+
+_STOP = object()
+
+
+def _produce(q, n, batch):
+    if batch:
+        items = list(range(batch))
+        for i in range(n // batch):
+            q.put_many(items)
+    else:
+        put = q.put
+        for i in range(n):
+            put(i)
+
+
+def _consume(q, nproducers, batch):
+    """consume until every producer has sent _STOP."""
+    stops = 0
+    if batch:
+        while stops < nproducers:
+            for item in q.get_many(batch):
+                if item is _STOP:
+                    stops += 1
+    else:
+        get = q.get
+        while stops < nproducers:
+            if get() is _STOP:
+                stops += 1
+
+
+def bench_blocking(producers=(1, 4, 16), n=400000, maxsize=10000, batch=256):
+    """Producer threads feeding one consumer: Queue.Queue put/get vs
+    BlockingFIFO put/get and put_many/get_many batches."""
+    print('%-26s %10s %14s' % ('queue', 'producers', 'items/sec'))
+    for nproducers in producers:
+        for name, q, b in (
+                ('Queue.Queue', Queue.Queue(maxsize), 0),
+                ('BlockingFIFO', BlockingFIFO(maxsize), 0),
+                ('BlockingFIFO batch=%d' % batch, BlockingFIFO(maxsize),
+                 batch)):
+            per_producer = n // nproducers
+            if b:
+                per_producer -= per_producer % b
+            threads = [threading.Thread(target=_produce,
+                                        args=(q, per_producer, b))
+                       for i in range(nproducers)]
+            consumer = threading.Thread(target=_consume,
+                                        args=(q, nproducers, b))
+            start = default_timer()
+            consumer.start()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            for t in threads:
+                q.put(_STOP)
+            consumer.join()
+            elapsed = default_timer() - start
+            print('%-26s %10d %14.0f' % (name, nproducers,
+                                         per_producer * nproducers / elapsed))
+
+
+BENCHMARKS = {
+    'blocking': bench_blocking,
+    'array_fifo': bench_array_fifo,
+    'batch': bench_batch,
+    'caches': bench_caches,
+    'contention': bench_contention,
+    'fifos': bench_fifos,
+    'policies': bench_policies,
+    'snapshot': bench_snapshot,
+}
+
+
+def main(argv):
+    for name in argv or sorted(BENCHMARKS):
+        print('== %s' % name, file=sys.stderr)
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
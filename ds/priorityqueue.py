@@ -1,16 +1,45 @@
 #!/usr/bin/env python
 
 """from python cookbook 2nd edition."""
-import Queue
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
 import heapq
+import itertools
+import sys
 import time
 
 
+def wait_until(condition, ready, block, timeout, exception):
+    """wait on condition until ready() holds, with its lock held.
+
+    Raises exception if not block and ready() does not hold, or if it
+    still does not after timeout seconds, like Queue.Queue.put() does.
+    """
+    if ready():
+        return
+    if not block:
+        raise exception
+    if timeout is None:
+        while not ready():
+            condition.wait()
+        return
+    deadline = time.time() + timeout
+    while not ready():
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise exception
+        condition.wait(remaining)
+
+
 class PriorityQueue(Queue.Queue):
     # initial
     def _init(self, maxsize):
         self.maxsize = maxsize
         self.queue = []
+        # the tiebreak of equal priorities, first in first out
+        self.counter = itertools.count()
 
     # return length of subitems in queue
     def _qsize(self):
@@ -34,9 +63,223 @@ class PriorityQueue(Queue.Queue):
 
     # real put and get
     def put(self, item, priority=0, block=True, timeout=None):
-        decorated_item = priority, time.time(), item
+        decorated_item = priority, next(self.counter), item
         Queue.Queue.put(self, decorated_item, block, timeout)
 
     def get(self, block=True, timeout=None):
-        priority, time_posted, item = Queue.Queue.get(self, block, timeout)
+        priority, seq, item = Queue.Queue.get(self, block, timeout)
         return item
+
+    # batched put and get, one lock acquisition per batch
+    def _room(self):
+        if self.maxsize <= 0:
+            return sys.maxsize
+        return self.maxsize - self._qsize()
+
+    def _put_batch(self, entries):
+        if len(entries) > len(self.queue):
+            # cheaper to rebuild the heap, O(n + k) than k O(log n) pushes
+            self.queue.extend(entries)
+            heapq.heapify(self.queue)
+        else:
+            for entry in entries:
+                self._put(entry)
+
+    def _put_many(self, entries, block, timeout):
+        # a batch that fits waits for room for all of it, so that it goes
+        # in at once or not at all
+        want = len(entries) if len(entries) <= self.maxsize else 1
+        pos = 0
+        self.not_full.acquire()
+        try:
+            while pos < len(entries):
+                try:
+                    wait_until(self.not_full, lambda: self._room() >= want,
+                               block, timeout, Queue.Full)
+                except Queue.Full as e:
+                    e.count = pos
+                    raise
+                n = min(self._room(), len(entries) - pos)
+                self._put_batch(entries[pos:pos + n])
+                pos += n
+                self.unfinished_tasks += n
+                self.not_empty.notify(n)
+        finally:
+            self.not_full.release()
+
+    def put_many(self, items, block=True, timeout=None):
+        """put (item, priority) pairs.
+
+        Up to maxsize pairs go in all at once or not at all. More go in as
+        the room frees up, each wait up to timeout seconds, and part of
+        them may be queued when Queue.Full is raised: its count attribute
+        says how many.
+
+        >>> q = PriorityQueue()
+        >>> q.put_many([('b', 1), ('a', 0), ('c', 1)])
+        >>> q.get_many(2), q.get_many(10)
+        (['a', 'b'], ['c'])
+        >>> q = PriorityQueue(3)
+        >>> q.put('a')
+        >>> try:
+        ...     q.put_many([('b', 1), ('c', 1), ('d', 1)], block=False)
+        ... except Queue.Full as e:
+        ...     print(e.count)
+        0
+        >>> q.qsize()
+        1
+        """
+        counter = self.counter
+        self._put_many([(priority, next(counter), item)
+                        for item, priority in items], block, timeout)
+
+    def get_many(self, max_n, block=True, timeout=None):
+        """get 1 to max_n items as a list, waiting only for the first."""
+        self.not_empty.acquire()
+        try:
+            wait_until(self.not_empty, self._qsize, block, timeout,
+                       Queue.Empty)
+            get = self._get
+            entries = [get() for i in range(min(max_n, self._qsize()))]
+            self.not_full.notify(len(entries))
+        finally:
+            self.not_empty.release()
+        return [entry[2] for entry in entries]
+
+
+# the fields of an IndexedPriorityQueue entry
+PRIORITY, SEQ, ITEM, POS = 0, 1, 2, 3
+
+
+class IndexedPriorityQueue(PriorityQueue):
+    """A PriorityQueue whose items can be reprioritized or removed.
+
+    put() returns a handle, the heap entry [priority, seq, item, pos]
+    which knows its position in the heap, so update_priority(handle) and
+    remove(handle) are O(log n) and leave no dead entry in the heap.
+    An item keeps its seq when its priority changes, it stays ahead of
+    the items of the same priority put after it.
+
+    Example:
+    >>> q = IndexedPriorityQueue()
+    >>> a = q.put('a', 5)
+    >>> b = q.put('b', 5)
+    >>> c = q.put('c', 7)
+    >>> q.update_priority(c, 1)
+    >>> q.remove(a)
+    'a'
+    >>> q.qsize(), q.get(), q.get(), q.empty()
+    (2, 'c', 'b', True)
+    """
+    def _put(self, entry):
+        entry[POS] = len(self.queue)
+        self.queue.append(entry)
+        self._sift_up(entry[POS])
+
+    def _put_batch(self, entries):
+        if len(entries) > len(self.queue):
+            self.queue.extend(entries)
+            heapq.heapify(self.queue)
+            for pos, entry in enumerate(self.queue):
+                entry[POS] = pos
+        else:
+            for entry in entries:
+                self._put(entry)
+
+    def _get(self):
+        return self._pop(0)
+
+    def _pop(self, pos):
+        heap = self.queue
+        entry = heap[pos]
+        last = heap.pop()
+        if last is not entry:
+            heap[pos] = last
+            last[POS] = pos
+            self._sift_up(pos)
+            self._sift_down(last[POS])
+        entry[POS] = None
+        return entry
+
+    def _sift_up(self, pos):
+        heap = self.queue
+        entry = heap[pos]
+        while pos:
+            parent_pos = (pos - 1) >> 1
+            parent = heap[parent_pos]
+            if not entry < parent:
+                break
+            heap[pos] = parent
+            parent[POS] = pos
+            pos = parent_pos
+        heap[pos] = entry
+        entry[POS] = pos
+
+    def _sift_down(self, pos):
+        heap = self.queue
+        n = len(heap)
+        entry = heap[pos]
+        while True:
+            child = 2 * pos + 1
+            if child >= n:
+                break
+            right = child + 1
+            if right < n and heap[right] < heap[child]:
+                child = right
+            if not heap[child] < entry:
+                break
+            heap[pos] = heap[child]
+            heap[pos][POS] = pos
+            pos = child
+        heap[pos] = entry
+        entry[POS] = pos
+
+    def _check(self, handle):
+        pos = handle[POS]
+        if pos is None or pos >= len(self.queue) or \
+                self.queue[pos] is not handle:
+            raise ValueError('the item is not in the queue')
+        return pos
+
+    def put(self, item, priority=0, block=True, timeout=None):
+        """put item, return its handle."""
+        entry = [priority, next(self.counter), item, None]
+        Queue.Queue.put(self, entry, block, timeout)
+        return entry
+
+    def get(self, block=True, timeout=None):
+        return Queue.Queue.get(self, block, timeout)[ITEM]
+
+    def put_many(self, items, block=True, timeout=None):
+        """put (item, priority) pairs, return their handles.
+
+        As PriorityQueue.put_many(), the Queue.Full raised also has the
+        handles of the items queued, as its handles attribute.
+        """
+        counter = self.counter
+        entries = [[priority, next(counter), item, None]
+                   for item, priority in items]
+        try:
+            self._put_many(entries, block, timeout)
+        except Queue.Full as e:
+            e.handles = entries[:e.count]
+            raise
+        return entries
+
+    def update_priority(self, handle, priority):
+        """change the priority of a queued item."""
+        with self.mutex:
+            pos = self._check(handle)
+            handle[PRIORITY] = priority
+            self._sift_up(pos)
+            self._sift_down(handle[POS])
+
+    def remove(self, handle):
+        """remove a queued item and return it, as if got and task_done."""
+        with self.mutex:
+            entry = self._pop(self._check(handle))
+            self.unfinished_tasks -= 1
+            if not self.unfinished_tasks:
+                self.all_tasks_done.notify_all()
+            self.not_full.notify()
+        return entry[ITEM]
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the queues in ds/priorityqueue.py.
+
+Usage: python -m snippetpy.ds.priorityqueue_bench [name ...]
+Run without names to run all of them.
+"""
+from __future__ import print_function
+
+import random
+import sys
+import threading
+from timeit import default_timer
+
+from snippetpy.ds.bucketqueue import BucketPriorityQueue, RadixPriorityQueue
+from snippetpy.ds.delayqueue import DelayQueue, WheelDelayQueue
+from snippetpy.ds.fairqueue import FairQueue
+from snippetpy.ds.priorityqueue import PriorityQueue, IndexedPriorityQueue
+
+
+class CountingLock(object):
+    """a Lock counting its acquisitions, waking up in a Condition.wait
+    included. It knows its owner, so Condition does not probe it."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.owner = None
+        self.acquisitions = 0
+
+    def acquire(self, blocking=True):
+        if not self.lock.acquire(blocking):
+            return False
+        self.owner = threading.current_thread()
+        self.acquisitions += 1
+        return True
+
+    def release(self):
+        self.owner = None
+        self.lock.release()
+
+    def _is_owned(self):
+        return self.owner is threading.current_thread()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def counting(q):
+    """make q use a CountingLock, return it."""
+    lock = q.mutex = CountingLock()
+    q.not_empty = threading.Condition(lock)
+    q.not_full = threading.Condition(lock)
+    q.all_tasks_done = threading.Condition(lock)
+    return lock
+
+
+_STOP = object()
+
+
+def _produce(q, items, batch):
+    if batch:
+        for i in range(0, len(items), batch):
+            q.put_many(items[i:i + batch])
+    else:
+        for item, priority in items:
+            q.put(item, priority)
+
+
+def _consume(q, producers, batch):
+    stopped = 0
+    while stopped < producers:
+        if batch:
+            got = q.get_many(batch)
+        else:
+            got = [q.get()]
+        stopped += sum(1 for item in got if item is _STOP)
+
+
+def bench_batch(producers=(1, 4), n=200000, maxsize=10000, batch=256):
+    """Producer threads feeding one consumer: put/get vs put_many/get_many,
+    with the lock acquisitions per item."""
+    print('%-32s %10s %12s %12s' % ('queue', 'producers', 'items/sec',
+                                    'locks/item'))
+    for nproducers in producers:
+        for cls in (PriorityQueue, IndexedPriorityQueue):
+            for b in (0, batch):
+                q = cls(maxsize)
+                lock = counting(q)
+                per_producer = n // nproducers
+                items = [(i, random.randint(0, 15))
+                         for i in range(per_producer)]
+                threads = [threading.Thread(target=_produce,
+                                            args=(q, items, b))
+                           for i in range(nproducers)]
+                consumer = threading.Thread(target=_consume,
+                                            args=(q, nproducers, b))
+                start = default_timer()
+                consumer.start()
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                for t in threads:
+                    # after everything else
+                    q.put(_STOP, sys.maxsize)
+                consumer.join()
+                elapsed = default_timer() - start
+                total = per_producer * nproducers
+                name = cls.__name__ + (' batch=%d' % b if b else '')
+                print('%-32s %10d %12.0f %12.3f' % (
+                    name, nproducers, total / elapsed,
+                    lock.acquisitions / float(total)))
+
+
+def bench_buckets(n=400000, levels=16, size=10000, batch=256):
+    """heapq vs buckets, single thread. levels: n items of 16 priorities
+    put then got in batches. hold: a queue of `size` timers, get one then
+    put one a random delay after it, one at a time."""
+    print('%-24s %8s %12s' % ('queue', 'load', 'items/sec'))
+    items = [(i, random.randint(0, levels - 1)) for i in range(n)]
+    for cls in (PriorityQueue, BucketPriorityQueue, RadixPriorityQueue):
+        q = cls()
+        start = default_timer()
+        for i in range(0, n, batch):
+            q.put_many(items[i:i + batch])
+        while not q.empty():
+            q.get_many(batch)
+        print('%-24s %8s %12.0f' % (cls.__name__, 'levels',
+                                    n / (default_timer() - start)))
+    delays = [random.randint(0, 1000) for i in range(n)]
+    for cls in (PriorityQueue, RadixPriorityQueue):
+        q = cls()
+        q.put_many((delay, delay) for delay in delays[:size])
+        start = default_timer()
+        for delay in delays:
+            now = q.get()
+            q.put(now + delay, now + delay)
+        print('%-24s %8s %12.0f' % (cls.__name__, 'hold',
+                                    n / (default_timer() - start)))
+
+
+def bench_delay(timers=(10000, 200000)):
+    """Scheduled retries: put `timers` items due in up to 10 minutes, then
+    cancel them, heap vs timing wheel."""
+    print('%-18s %8s %12s %12s' % ('queue', 'timers', 'puts/sec',
+                                   'cancels/sec'))
+    for n in timers:
+        delays = [random.uniform(1, 600) for i in range(n)]
+        for cls in (DelayQueue, WheelDelayQueue):
+            q = cls()
+            start = default_timer()
+            handles = [q.put(i, delay) for i, delay in enumerate(delays)]
+            put = n / (default_timer() - start)
+            random.shuffle(handles)
+            start = default_timer()
+            for handle in handles:
+                q.cancel(handle)
+            cancel = n / (default_timer() - start)
+            print('%-18s %8d %12.0f %12.0f' % (cls.__name__, n, put,
+                                               cancel))
+
+
+def bench_fair(n=200000, tenants=(10, 1000, 100000), flood=10000,
+               batch=256):
+    """FairQueue vs PriorityQueue, where all the items have the same
+    priority: items/sec of n items from `tenants` tenants, put then got in
+    batches, and where the item of a quiet tenant comes out after a noisy
+    one put `flood` items."""
+    print('%-16s %8s %12s %10s' % ('queue', 'tenants', 'items/sec',
+                                   'quiet at'))
+    for k in tenants:
+        items = [(i, random.randrange(k)) for i in range(n)]
+        for cls in (PriorityQueue, FairQueue):
+            fair = cls is FairQueue
+            q = cls()
+            start = default_timer()
+            for i in range(0, n, batch):
+                q.put_many(items[i:i + batch] if fair else
+                           [(item, 0) for item, tenant in
+                            items[i:i + batch]])
+            while not q.empty():
+                q.get_many(batch)
+            rate = n / (default_timer() - start)
+            q.put_many(('noisy', 'noisy' if fair else 0)
+                       for i in range(flood))
+            q.put('quiet', 'quiet' if fair else 0)
+            position = q.get_many(flood + 1).index('quiet')
+            print('%-16s %8d %12.0f %10d' % (cls.__name__, k, rate,
+                                             position))
+
+
+BENCHMARKS = {
+    'batch': bench_batch,
+    'buckets': bench_buckets,
+    'delay': bench_delay,
+    'fair': bench_fair,
+}
+
+
+def main(argv):
+    for name in argv or sorted(BENCHMARKS):
+        print('== %s' % name, file=sys.stderr)
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
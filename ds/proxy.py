@@ -2,6 +2,10 @@
 # -*- coding: utf-8 -*-
 
 """from python cookbook 2nd edition."""
+import inspect
+import operator
+import threading
+import types
 
 
 class Proxy(object):
@@ -22,12 +26,42 @@ def make_binder(unbounded_method):
     f.__name__ = unbounded_method.__name__
     return f
 
+
+# what a class holds as a plain method: functions, and the methods of the
+# builtin types such as list.append
+_METHOD_TYPES = (types.FunctionType, type(list.append))
+
+
+def public_methods(obj_cls):
+    """the names of the public methods of obj_cls."""
+    methods = set()
+    for klass in reversed(inspect.getmro(obj_cls)):
+        for name, value in vars(klass).items():
+            if name.startswith('_'):
+                continue
+            if isinstance(value, _METHOD_TYPES):
+                methods.add(name)
+            else:
+                # overridden by a property, a staticmethod...
+                methods.discard(name)
+    return methods
+
+
+def make_delegate(name):
+    """a property getting name from self._obj, all in C."""
+    return property(operator.attrgetter('_obj.' + name))
+
 known_proxy_classes = {}
 
 
-def proxy(obj, *specials):
+def proxy(obj, *specials, **kwargs):
     """Factory function that can delegate special functions to an obj.
 
+    With compiled=True the proxy class also gets a property for every public
+    method of the class of obj, made once per class, which returns the
+    method of obj without __getattr__ or any python call in between. The
+    other attributes still go through __getattr__.
+
     Example:
     >>> o = proxy([], 'len', 'iter')
     >>> type(o)
@@ -42,15 +76,117 @@ def proxy(obj, *specials):
     ...    print('error becuase __getitem__ not delegated.')
     ...
     error becuase __getitem__ not delegated.
+    >>> c = proxy({}, 'len', compiled=True)
+    >>> 'get' in vars(type(c)), 'get' in vars(type(proxy({})))
+    (True, False)
+    >>> c.update(a=1)
+    >>> c.get('a'), len(c)
+    (1, 1)
     """
-    obj_cls = obj.__class__
-    key = obj_cls, specials
+    return proxy_class(obj.__class__, specials,
+                       _compiled_flag(kwargs))(obj)
+
+
+def _compiled_flag(kwargs):
+    compiled = kwargs.pop('compiled', False)
+    if kwargs:
+        raise TypeError('unexpected keyword arguments %s'
+                        % ', '.join(kwargs))
+    return compiled
+
+
+def proxy_class(obj_cls, specials=(), compiled=False):
+    """the Proxy class of proxy() for the objects of obj_cls."""
+    key = obj_cls, specials, compiled
     cls = known_proxy_classes.get(key)
     if cls is None:
         cls = type('%sProxy' % obj_cls.__name__, (Proxy,), {})
+        if compiled:
+            for name in public_methods(obj_cls):
+                setattr(cls, name, make_delegate(name))
         for name in specials:
             name = '__%s__' % name
             unbounded_method = getattr(obj_cls, name)
             setattr(cls, name, make_binder(unbounded_method))
         known_proxy_classes[key] = cls
-    return cls(obj)
+    return cls
+
+
+class LazyProxy(Proxy):
+    """Base of the lazy Proxy classes, see lazy_proxy()."""
+    _specials = ()
+    _compiled = False
+
+    def __init__(self, factory):
+        # no obj yet, so no Proxy.__init__
+        self._factory = factory
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        if attr in ('_obj', '_factory', '_lock'):
+            raise AttributeError(attr)
+        return getattr(self._materialize(), attr)
+
+    def _materialize(self):
+        """build the obj once, then become a plain proxy of it."""
+        d = self.__dict__
+        if '_obj' not in d:
+            with self._lock:
+                if '_obj' not in d:
+                    obj = self._factory()
+                    d['_obj'] = obj
+                    # change the state of the instance to a proxy of obj
+                    # forever, __getattr__ and the specials of the lazy
+                    # class are not called anymore
+                    self.__class__ = proxy_class(obj.__class__,
+                                                 self._specials,
+                                                 self._compiled)
+                    del d['_factory']
+        return d['_obj']
+
+
+def make_lazy_binder(name):
+    def f(self, *args, **kwargs):
+        # call obj directly, self may still be of the lazy class while
+        # another thread is materializing it
+        obj = self._materialize()
+        return getattr(obj.__class__, name)(obj, *args, **kwargs)
+    f.__name__ = name
+    return f
+
+known_lazy_classes = {}
+
+
+def lazy_proxy(factory, *specials, **kwargs):
+    """A proxy of the obj factory() returns, built on first use.
+
+    The first access to an attribute or to one of the special methods
+    delegated calls factory(), once even from many threads. Then the
+    proxy turns into what proxy(obj, *specials, **kwargs) returns, so it
+    is no slower than that. If factory() raises, the next use tries again.
+
+    Example:
+    >>> calls = []
+    >>> def make():
+    ...     calls.append(1)
+    ...     return [3, 1, 2]
+    >>> o = lazy_proxy(make, 'len', 'iter')
+    >>> calls, type(o).__name__
+    ([], 'LazyProxy')
+    >>> len(o), calls, type(o).__name__
+    (3, [1], 'listProxy')
+    >>> o.sort()
+    >>> list(o), calls
+    ([1, 2, 3], [1])
+    """
+    compiled = _compiled_flag(kwargs)
+    key = specials, compiled
+    cls = known_lazy_classes.get(key)
+    if cls is None:
+        cls = type('LazyProxy', (LazyProxy,),
+                   {'_specials': specials, '_compiled': compiled})
+        for name in specials:
+            name = '__%s__' % name
+            setattr(cls, name, make_lazy_binder(name))
+        known_lazy_classes[key] = cls
+    return cls(factory)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the proxies in ds/proxy.py.
+
+Usage: python -m snippetpy.ds.proxy_bench [name ...]
+Run without names to run all of them.
+"""
+from __future__ import print_function
+
+import itertools
+import sys
+from timeit import default_timer
+
+from snippetpy.ds.proxy import Proxy, proxy, lazy_proxy
+
+
+class Point(object):
+    def __init__(self, x):
+        self.x = x
+
+    def norm(self):
+        return self.x
+
+
+def _call_norm(o, number):
+    start = default_timer()
+    for i in itertools.repeat(None, number):
+        o.norm()
+    return default_timer() - start
+
+
+def _call_get(o, number):
+    start = default_timer()
+    for i in itertools.repeat(None, number):
+        o.get(1)
+    return default_timer() - start
+
+
+def bench_calls(number=1000000):
+    """ns per method call: direct, through Proxy.__getattr__, and through
+    the attrgetter properties make_delegate builds for proxy(compiled=True)."""
+    print('%-20s %-10s %10s %10s' % ('method', 'way', 'ns/call',
+                                     'overhead'))
+    for label, obj, call in (('Point.norm', Point(1), _call_norm),
+                             ('dict.get', {1: 2}, _call_get)):
+        direct = None
+        for way, o in (('direct', obj), ('Proxy', Proxy(obj)),
+                       ('compiled', proxy(obj, compiled=True))):
+            ns = min(call(o, number) for i in range(3)) / number * 1e9
+            if direct is None:
+                direct = ns
+            print('%-20s %-10s %10.1f %10.1f' % (label, way, ns,
+                                                 ns - direct))
+
+
+def _build_index(size=50000):
+    return dict((i, str(i)) for i in range(size))
+
+
+def bench_lazy(n=100, used=10, number=1000000):
+    """Startup: building n indexes of which only `used` are used, eagerly
+    vs behind lazy_proxy(), then ns per call once built."""
+    print('%-10s %12s %12s %10s' % ('way', 'startup ms', 'first use ms',
+                                    'ns/call'))
+    for way in ('eager', 'lazy'):
+        start = default_timer()
+        if way == 'eager':
+            indexes = [proxy(_build_index(), compiled=True)
+                       for i in range(n)]
+        else:
+            indexes = [lazy_proxy(_build_index, compiled=True)
+                       for i in range(n)]
+        startup = default_timer() - start
+        start = default_timer()
+        for o in indexes[:used]:
+            o.get(1)
+        first = default_timer() - start
+        ns = min([_call_get(indexes[0], number)
+                  for i in range(3)]) / number * 1e9
+        print('%-10s %12.1f %12.1f %10.1f' % (way, startup * 1e3,
+                                              first * 1e3, ns))
+        # not in the startup of the next one
+        del indexes
+
+
+BENCHMARKS = {
+    'calls': bench_calls,
+    'lazy': bench_lazy,
+}
+
+
+def main(argv):
+    for name in argv or sorted(BENCHMARKS):
+        print('== %s' % name, file=sys.stderr)
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
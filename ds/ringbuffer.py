@@ -2,6 +2,15 @@
 # -*- coding: utf-8 -*-
 
 """from python cookbook 2nd edition."""
+from __future__ import print_function
+
+import math
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class RingBuffer(object):
@@ -33,21 +42,355 @@ class RingBuffer(object):
         return self.data
 
 
+class NumericRingBuffer(object):
+    """a ringbuffer of numbers, in a preallocated numpy array.
+
+    Every value is written twice, at i and at i + size_max, so the values
+    in real order are always one slice of the array: view() returns them
+    without copying, and the statistics run on that view without building
+    a list. A view shows the data of the moment, later appends change it.
+    The statistics are None while it is empty, as those of TimeWindow.
+
+    Example:
+    >>> r = NumericRingBuffer(4)
+    >>> print(r.mean(), r.max())
+    None None
+    >>> r.extend([1, 2, 3])
+    >>> r.tolist()
+    [1.0, 2.0, 3.0]
+    >>> r.extend(numpy.arange(4, 9))
+    >>> r.append(9)
+    >>> r.tolist()
+    [6.0, 7.0, 8.0, 9.0]
+    >>> print(r.mean(), r.min(), r.max(), r.percentile(50))
+    7.5 6.0 9.0 7.5
+    """
+    def __init__(self, size_max, dtype=float):
+        if numpy is None:
+            raise ImportError('NumericRingBuffer needs numpy')
+        self.size_max = size_max
+        self.data = numpy.zeros(2 * size_max, dtype)
+        # where the next value goes, and how many values there are
+        self.cur = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, x):
+        """ add an element at the end of the buffer """
+        self.data[self.cur] = self.data[self.cur + self.size_max] = x
+        self.cur = (self.cur + 1) % self.size_max
+        if self.count < self.size_max:
+            self.count += 1
+
+    def extend(self, values):
+        """ add all the values, a numpy array or any sequence """
+        values = numpy.asarray(values, self.data.dtype)
+        size_max = self.size_max
+        n = len(values)
+        if n > size_max:
+            values = values[-size_max:]
+            n = size_max
+        data = self.data
+        cur = self.cur
+        k = min(n, size_max - cur)
+        data[cur:cur + k] = data[cur + size_max:cur + size_max + k] = \
+            values[:k]
+        if k < n:
+            data[:n - k] = data[size_max:size_max + n - k] = values[k:]
+        self.cur = (cur + n) % size_max
+        self.count = min(self.count + n, size_max)
+
+    def view(self):
+        """ a read-only view of the values in real order """
+        start = (self.cur - self.count) % self.size_max
+        v = self.data[start:start + self.count]
+        v.flags.writeable = False
+        return v
+
+    def tolist(self):
+        """ return the list with real order """
+        return self.view().tolist()
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.view().mean()
+
+    def min(self):
+        if not self.count:
+            return None
+        return self.view().min()
+
+    def max(self):
+        if not self.count:
+            return None
+        return self.view().max()
+
+    def std(self):
+        if not self.count:
+            return None
+        return self.view().std()
+
+    def percentile(self, q):
+        """ the q-th percentile of the values, q in [0, 100] """
+        if not self.count:
+            return None
+        return numpy.percentile(self.view(), q)
+
+
+class ByteRingBuffer(object):
+    """a ringbuffer of bytes, over a preallocated bytearray.
+
+    It hands out memoryviews of its own storage, so I/O does not need
+    intermediate strings: sock.recv_into(b.writable()) then commit(n) the
+    bytes received, sock.send(b.readable()) or parse it, then consume(n)
+    the bytes used. A view covers one contiguous region only, when the
+    data wraps around the end, call again after commit() or consume().
+
+    Example:
+    >>> b = ByteRingBuffer(8)
+    >>> w = b.writable()
+    >>> w[:5] = b'hello'
+    >>> b.commit(5)
+    >>> print(b.readable().tobytes().decode())
+    hello
+    >>> b.consume(3)
+    >>> b.write(b'world!')
+    6
+    >>> print(b.readable().tobytes().decode(), b.read(8).decode())
+    lowor loworld!
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        # the first unread byte and how many bytes are buffered
+        self.start = 0
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def free(self):
+        return self.capacity - self.length
+
+    def writable(self):
+        """ a view of free space, to be followed by commit() """
+        if not self.length:
+            self.start = 0
+        end = self.start + self.length
+        if end >= self.capacity:
+            return self.view[end - self.capacity:self.start]
+        return self.view[end:]
+
+    def commit(self, n):
+        """ n bytes were written into the view of writable() """
+        if n > self.free():
+            raise ValueError('commit more than the free space')
+        self.length += n
+
+    def readable(self):
+        """ a view of buffered bytes, to be followed by consume() """
+        return self.view[self.start:
+                         min(self.start + self.length, self.capacity)]
+
+    def consume(self, n):
+        """ n bytes at the front were used """
+        if n > self.length:
+            raise ValueError('consume more than the buffered bytes')
+        self.length -= n
+        self.start = (self.start + n) % self.capacity
+
+    def write(self, data):
+        """ copy as much of data as fits, return how many bytes """
+        data = memoryview(data)
+        written = 0
+        while written < len(data):
+            w = self.writable()
+            n = min(len(w), len(data) - written)
+            if not n:
+                break
+            w[:n] = data[written:written + n]
+            self.commit(n)
+            written += n
+        return written
+
+    def peek(self, n=None):
+        """ a copy of up to n buffered bytes, leaving them buffered """
+        if n is None or n > self.length:
+            n = self.length
+        end = self.start + n
+        if end <= self.capacity:
+            return self.view[self.start:end].tobytes()
+        return (self.view[self.start:].tobytes() +
+                self.view[:end - self.capacity].tobytes())
+
+    def read(self, n=None):
+        """ a copy of up to n buffered bytes, consumed """
+        data = self.peek(n)
+        self.consume(len(data))
+        return data
+
+
+class TimeWindow(object):
+    """counters of the values added in the last `window` seconds.
+
+    The window is a ring of `buckets` buckets of window / buckets seconds
+    each, with the count, sum, min, max and a histogram of the values that
+    fell in it. add() updates one bucket, O(1), and a bucket is reset when
+    the ring comes around to it again, so the memory does not depend on
+    the rate. The queries merge the buckets, O(buckets). The window moves
+    a bucket at a time: it is the current bucket and the buckets - 1
+    before it. Values older than that are dropped.
+
+    The histogram bins grow by a factor of 1 + 2 * error, so percentile()
+    is off by at most `error`, relatively, and a bucket has one bin per
+    such step between its min and max. It is meant for values >= 0,
+    like latencies or sizes, the others are counted as 0.
+
+    Example:
+    >>> w = TimeWindow(window=60, buckets=6)
+    >>> for ts in range(100):
+    ...     w.add(ts % 10 + 1, ts)
+    >>> w.count(now=99), w.sum(now=99), w.rate(now=99)
+    (60, 330, 1.0)
+    >>> w.min(now=99), w.max(now=99), round(w.percentile(50, now=99), 1)
+    (1, 10, 5.0)
+    >>> w.add(100, ts=10)
+    >>> w.count(now=130), w.max(now=130)
+    (20, 10)
+    >>> w.count(now=200), w.percentile(50, now=200)
+    (0, None)
+    """
+    def __init__(self, window=60.0, buckets=60, timer=time.time,
+                 error=0.01):
+        self.window = window
+        self.buckets = buckets
+        self.interval = float(window) / buckets
+        self.timer = timer
+        self.error = error
+        self._log_factor = math.log(1 + 2 * error)
+        # bucket i holds the values of interval stamps[i], None if unused
+        self.stamps = [None] * buckets
+        self.counts = [0] * buckets
+        self.sums = [0] * buckets
+        self.mins = [None] * buckets
+        self.maxs = [None] * buckets
+        self.hists = [None] * buckets
+
+    def _bin(self, value):
+        if value <= 0:
+            return None
+        return int(math.floor(math.log(value) / self._log_factor))
+
+    def add(self, value=1, ts=None):
+        """ count value at time ts, now by default """
+        if ts is None:
+            ts = self.timer()
+        t = int(ts // self.interval)
+        i = t % self.buckets
+        stamp = self.stamps[i]
+        if stamp != t:
+            if stamp is not None and stamp > t:
+                # the ring moved on, ts is out of the window
+                return
+            self.stamps[i] = t
+            self.counts[i] = 0
+            self.sums[i] = 0
+            self.mins[i] = self.maxs[i] = value
+            self.hists[i] = {}
+        elif value < self.mins[i]:
+            self.mins[i] = value
+        elif value > self.maxs[i]:
+            self.maxs[i] = value
+        self.counts[i] += 1
+        self.sums[i] += value
+        hist = self.hists[i]
+        k = self._bin(value)
+        hist[k] = hist.get(k, 0) + 1
+
+    def clear(self):
+        self.stamps = [None] * self.buckets
+
+    def _live(self, now):
+        """ the indexes of the buckets in the window at now """
+        if now is None:
+            now = self.timer()
+        t = int(now // self.interval)
+        oldest = t - self.buckets
+        return [i for i, stamp in enumerate(self.stamps)
+                if stamp is not None and oldest < stamp <= t]
+
+    def count(self, now=None):
+        return sum(self.counts[i] for i in self._live(now))
+
+    def sum(self, now=None):
+        return sum(self.sums[i] for i in self._live(now))
+
+    def rate(self, now=None):
+        """ the count per second over the window """
+        return self.count(now) / float(self.window)
+
+    def mean(self, now=None):
+        live = self._live(now)
+        n = sum(self.counts[i] for i in live)
+        if not n:
+            return None
+        return sum(self.sums[i] for i in live) / float(n)
+
+    def min(self, now=None):
+        live = self._live(now)
+        return min(self.mins[i] for i in live) if live else None
+
+    def max(self, now=None):
+        live = self._live(now)
+        return max(self.maxs[i] for i in live) if live else None
+
+    def percentile(self, q, now=None):
+        """ the q-th percentile of the values, q in [0, 100] """
+        live = self._live(now)
+        merged = {}
+        for i in live:
+            for k, n in self.hists[i].items():
+                merged[k] = merged.get(k, 0) + n
+        total = sum(merged.values())
+        if not total:
+            return None
+        rank = max(1, int(math.ceil(q / 100.0 * total)))
+        seen = 0
+        # the bin of the values <= 0 is None, it comes first
+        keys = sorted(k for k in merged if k is not None)
+        if None in merged:
+            keys.insert(0, None)
+        for k in keys:
+            seen += merged[k]
+            if seen >= rank:
+                break
+        if k is None:
+            value = 0
+        else:
+            # the middle of the bin, within error of any value in it
+            value = math.exp(k * self._log_factor) * (1 + self.error)
+        return max(min(value, self.max(now)), self.min(now))
+
+
 def main():
     x = RingBuffer(5)
     x.append(1)
     x.append(2)
     x.append(3)
     x.append(4)
-    print x.__class__, x.tolist()
+    print(x.__class__, x.tolist())
     x.append(5)
     x.append(6)
     x.append(7)
-    print x.__class__, x.tolist()
+    print(x.__class__, x.tolist())
     x.append(8)
     x.append(9)
     x.append(10)
-    print x.__class__, x.tolist()
+    print(x.__class__, x.tolist())
 
 if __name__ == "__main__":
     main()
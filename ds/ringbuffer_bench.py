@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the structures in ds/ringbuffer.py and
+ds/sharedringbuffer.py.
+
+Usage: python -m snippetpy.ds.ringbuffer_bench [name ...]
+Run without names to run all of them.
+"""
+from __future__ import print_function
+
+import multiprocessing
+import socket
+import sys
+import threading
+from timeit import default_timer
+
+from snippetpy.ds.ringbuffer import ByteRingBuffer
+
+try:
+    from snippetpy.ds.sharedringbuffer import SharedRingBuffer
+except ImportError:
+    SharedRingBuffer = None
+
+
+def _send_all(sock, total, chunk):
+    data = b'x' * chunk
+    sent = 0
+    while sent < total:
+        sent += sock.send(data[:min(chunk, total - sent)])
+    sock.shutdown(socket.SHUT_WR)
+
+
+def _recv_concat(sock, record, bufsize):
+    """the usual way: recv() a string, append it, slice the records."""
+    buf = b''
+    records = 0
+    while True:
+        data = sock.recv(bufsize)
+        if not data:
+            break
+        buf += data
+        pos = 0
+        while len(buf) - pos >= record:
+            buf[pos:pos + record]
+            pos += record
+            records += 1
+        buf = buf[pos:]
+    return records
+
+
+def _recv_ring(sock, record, bufsize):
+    """recv_into() the ring, parse the records in place."""
+    ring = ByteRingBuffer(bufsize * 2)
+    records = 0
+    while True:
+        n = sock.recv_into(ring.writable())
+        if not n:
+            break
+        ring.commit(n)
+        while len(ring) >= record:
+            view = ring.readable()
+            end = len(view) - len(view) % record
+            if not end:
+                # the record wraps around the end of the buffer
+                ring.read(record)
+                records += 1
+                continue
+            for pos in range(0, end, record):
+                view[pos:pos + record]
+            records += end // record
+            ring.consume(end)
+    return records
+
+
+def bench_bytes(total=200 * 1024 * 1024, records=(100, 16384),
+                bufsize=65536):
+    """Receiving fixed size records from a socket: bytes concatenation
+    vs recv_into() a ByteRingBuffer."""
+    print('%-10s %10s %10s %12s' % ('way', 'record', 'MB/s', 'records'))
+    for record in records:
+        for name, recv in (('concat', _recv_concat), ('ring', _recv_ring)):
+            a, b = socket.socketpair()
+            sender = threading.Thread(target=_send_all,
+                                      args=(a, total, bufsize))
+            start = default_timer()
+            sender.start()
+            n = recv(b, record, bufsize)
+            elapsed = default_timer() - start
+            sender.join()
+            a.close()
+            b.close()
+            print('%-10s %10d %10.1f %12d' % (
+                name, record, total / elapsed / 2 ** 20, n))
+
+
+def _consume_queue(q, done):
+    n = 0
+    while q.get() is not None:
+        n += 1
+    done.put(n)
+
+
+def _consume_ring(ring, consumer, done):
+    n = 0
+    while True:
+        batch = ring.get_many(consumer, 256)
+        if not batch[-1]:
+            n += len(batch) - 1
+            break
+        n += len(batch)
+    ring.close()
+    done.put(n)
+
+
+def bench_shared(total=200000, size=256, consumers=(1, 4)):
+    """Fanning messages out to consumer processes: a multiprocessing.Queue
+    per consumer vs one SharedRingBuffer. An empty message ends it."""
+    if SharedRingBuffer is None:
+        print('SharedRingBuffer needs python 3.8+, skipped')
+        return
+    data = b'x' * size
+    print('%-10s %10s %12s %12s' % ('way', 'consumers', 'msgs/s',
+                                     'received'))
+    for k in consumers:
+        done = multiprocessing.Queue()
+        queues = [multiprocessing.Queue(1024) for i in range(k)]
+        procs = [multiprocessing.Process(target=_consume_queue,
+                                         args=(q, done)) for q in queues]
+        start = default_timer()
+        for p in procs:
+            p.start()
+        for i in range(total):
+            for q in queues:
+                q.put(data)
+        for q in queues:
+            q.put(None)
+        received = sum(done.get() for p in procs)
+        elapsed = default_timer() - start
+        for p in procs:
+            p.join()
+        print('%-10s %10d %12.0f %12d' % ('queue', k, total / elapsed,
+                                          received))
+
+        ring = SharedRingBuffer(1024, size, k)
+        procs = [multiprocessing.Process(target=_consume_ring,
+                                         args=(ring, i, done))
+                 for i in range(k)]
+        start = default_timer()
+        for p in procs:
+            p.start()
+        for i in range(total):
+            ring.put(data)
+        ring.put(b'')
+        received = sum(done.get() for p in procs)
+        elapsed = default_timer() - start
+        for p in procs:
+            p.join()
+        ring.close()
+        ring.unlink()
+        print('%-10s %10d %12.0f %12d' % ('shared', k, total / elapsed,
+                                          received))
+
+
+BENCHMARKS = {
+    'bytes': bench_bytes,
+    'shared': bench_shared,
+}
+
+
+def main(argv):
+    for name in argv or sorted(BENCHMARKS):
+        print('== %s' % name, file=sys.stderr)
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
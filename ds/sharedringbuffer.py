@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A ringbuffer in shared memory between processes, for python 3.8+."""
+import queue
+import struct
+import time
+from multiprocessing import shared_memory
+
+
+_SEQ = struct.Struct('<Q')
+_LEN = struct.Struct('<I')
+
+
+class SharedRingBuffer(object):
+    """a single producer, multi consumer ringbuffer in shared memory.
+
+    One multiprocessing.shared_memory block holds a header and `slots`
+    fixed size slots, each a message of up to slot_size bytes. Messages
+    are copied in and out of the block as bytes, nothing is pickled.
+    Every consumer sees every message: consumer i reads with get(i) and
+    its own read cursor, and put() waits while the slowest consumer is
+    `slots` messages behind, so a consumer that stops reading stops the
+    producer too.
+
+    There are no locks: only the producer writes the slots and the write
+    cursor, only consumer i writes cursor i, and a cursor moves with one
+    aligned 8 bytes store after the slot it covers is written or read.
+    That relies on stores not being reordered, as on x86-64. Waiting for
+    data or room polls, sleeping poll_min then up to poll_max seconds.
+
+    Other processes get the buffer as an argument of Process (it pickles
+    by name) or with SharedRingBuffer.attach(name). Each one close()s it,
+    the creator unlink()s it at the end.
+
+    Example:
+    >>> r = SharedRingBuffer(slots=4, slot_size=16, consumers=2)
+    >>> for i in range(4):
+    ...     r.put(b'msg %d' % i)
+    >>> print(r.get(0), r.get(0))
+    b'msg 0' b'msg 1'
+    >>> r.get_many(1)
+    [b'msg 0', b'msg 1', b'msg 2', b'msg 3']
+    >>> r.put(b'msg 4')
+    >>> r.put(b'msg 5')
+    >>> try:
+    ...     r.put(b'msg 6', block=False)
+    ... except queue.Full:
+    ...     print('full, consumer 0 is 4 messages behind')
+    full, consumer 0 is 4 messages behind
+    >>> r.wait(1, timeout=0.01), r.pending(1)
+    (True, 2)
+    >>> r.get_many(1)
+    [b'msg 4', b'msg 5']
+    >>> r.wait(1, timeout=0.01)
+    False
+    >>> r.close()
+    >>> r.unlink()
+    """
+    MAGIC = b'SPRB'
+    poll_min = 0.00005
+    poll_max = 0.001
+
+    # magic, slots, slot_size, consumers. The cursors get a cache line
+    # each, so the processes do not write to the same line.
+    _HEADER = struct.Struct('<4sIII')
+    _WRITE = 64
+
+    def __init__(self, slots, slot_size, consumers=1, name=None):
+        stride = (_LEN.size + slot_size + 7) & ~7
+        size = self._WRITE + 64 * (consumers + 1) + slots * stride
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self._HEADER.pack_into(shm.buf, 0, self.MAGIC, slots, slot_size,
+                               consumers)
+        self._setup(shm)
+
+    @classmethod
+    def attach(cls, name):
+        """ the SharedRingBuffer another process created as name """
+        shm = shared_memory.SharedMemory(name)
+        if bytes(shm.buf[:4]) != cls.MAGIC:
+            shm.close()
+            raise ValueError('%s is not a SharedRingBuffer' % name)
+        self = cls.__new__(cls)
+        self._setup(shm)
+        return self
+
+    def _setup(self, shm):
+        self.shm = shm
+        self.name = shm.name
+        self.buf = shm.buf
+        magic, self.slots, self.slot_size, self.consumers = \
+            self._HEADER.unpack_from(self.buf, 0)
+        self.stride = (_LEN.size + self.slot_size + 7) & ~7
+        self.base = self._WRITE + 64 * (self.consumers + 1)
+        # put() can write up to here without looking at the cursors
+        self._limit = 0
+
+    def __reduce__(self):
+        return self.__class__.attach, (self.name,)
+
+    def close(self):
+        """ detach this process, the buffer is unusable afterwards """
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        """ free the shared memory, once every process is done """
+        self.shm.unlink()
+
+    def _cursor(self, consumer):
+        if not 0 <= consumer < self.consumers:
+            raise IndexError('no consumer %r' % (consumer,))
+        return self._WRITE + 64 * (consumer + 1)
+
+    def _written(self):
+        return _SEQ.unpack_from(self.buf, self._WRITE)[0]
+
+    def _min_read(self):
+        unpack = _SEQ.unpack_from
+        return min(unpack(self.buf, self._WRITE + 64 * (i + 1))[0]
+                   for i in range(self.consumers))
+
+    def _wait(self, ready, block, timeout):
+        if ready():
+            return True
+        if not block:
+            return False
+        delay = self.poll_min
+        end = None if timeout is None else time.time() + timeout
+        while not ready():
+            sleep = delay
+            if end is not None:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    return False
+                sleep = min(delay, remaining)
+            time.sleep(sleep)
+            delay = min(delay * 2, self.poll_max)
+        return True
+
+    def pending(self, consumer):
+        """ how many messages consumer has not read yet """
+        return self._written() - _SEQ.unpack_from(self.buf,
+                                                  self._cursor(consumer))[0]
+
+    def wait(self, consumer, timeout=None):
+        """ wait until consumer has a message, False on timeout """
+        return self._wait(lambda: self.pending(consumer), True, timeout)
+
+    def put(self, data, block=True, timeout=None):
+        """ publish data, bytes of up to slot_size, to all the consumers.
+
+        Raises queue.Full if the slowest consumer is still `slots`
+        messages behind after timeout, or right away if not block.
+        """
+        n = len(data)
+        if n > self.slot_size:
+            raise ValueError('a message of %d bytes, the slots hold %d'
+                             % (n, self.slot_size))
+        seq = self._written()
+        if seq >= self._limit:
+            def ready():
+                self._limit = self._min_read() + self.slots
+                return seq < self._limit
+            if not self._wait(ready, block, timeout):
+                raise queue.Full
+        offset = self.base + (seq % self.slots) * self.stride
+        _LEN.pack_into(self.buf, offset, n)
+        self.buf[offset + _LEN.size:offset + _LEN.size + n] = data
+        _SEQ.pack_into(self.buf, self._WRITE, seq + 1)
+
+    def get(self, consumer, block=True, timeout=None):
+        """ the next message of consumer, queue.Empty if there is none """
+        return self.get_many(consumer, 1, block, timeout)[0]
+
+    def get_many(self, consumer, max_n=None, block=True, timeout=None):
+        """ up to max_n next messages of consumer, at least one.
+
+        The cursor moves once for the whole batch, so the producer sees
+        the room freed at once.
+        """
+        cursor = self._cursor(consumer)
+        seq = _SEQ.unpack_from(self.buf, cursor)[0]
+        if not self._wait(lambda: self._written() > seq, block, timeout):
+            raise queue.Empty
+        end = self._written()
+        if max_n is not None:
+            end = min(end, seq + max_n)
+        buf = self.buf
+        result = []
+        for s in range(seq, end):
+            offset = self.base + (s % self.slots) * self.stride
+            n = _LEN.unpack_from(buf, offset)[0]
+            start = offset + _LEN.size
+            result.append(buf[start:start + n].tobytes())
+        _SEQ.pack_into(buf, cursor, end)
+        return result
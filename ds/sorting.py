@@ -144,6 +144,10 @@ class Ratings(UserDict.DictMixin, dict):
     ['tom', 'john', 'paul', 'bob']
     >>> r.values()
     [10, 20, 20, 30]
+    >>> r.count_between(15, 30), r.keys_between(15, 30)
+    (2, ['john', 'paul'])
+    >>> r.percentile('paul'), r.get_val_by_percentile(50)
+    (50.0, 20)
     """
 
     def __init__(self, *args, **kwargs):
@@ -152,7 +156,7 @@ class Ratings(UserDict.DictMixin, dict):
         self._rating.sort()
 
     def copy(self):
-        return Ratings(self)
+        return self.__class__(self)
 
     def __setitem__(self, k, v):
         # delegate most works to dict, handling self._rating
@@ -192,3 +196,209 @@ class Ratings(UserDict.DictMixin, dict):
 
     def get_key_by_rating(self, rating):
         return self._rating[rating][1]
+
+    # range and percentile queries, on top of the three methods below that
+    # a subclass can implement with another structure.
+    def _bisect(self, item):
+        return bisect_left(self._rating, item)
+
+    def _item(self, rating):
+        return self._rating[rating]
+
+    def _items(self, start, stop):
+        return self._rating[start:stop]
+
+    def count_between(self, low, high):
+        """how many keys have a value in [low, high)."""
+        return self._bisect((high,)) - self._bisect((low,))
+
+    def keys_between(self, low, high):
+        """the keys of the values in [low, high), lowest first."""
+        return [k for v, k in self._items(self._bisect((low,)),
+                                          self._bisect((high,)))]
+
+    def percentile(self, key):
+        """the percentage of the keys rated below key."""
+        return 100.0 * self.rating(key) / len(self)
+
+    def get_val_by_percentile(self, q):
+        """the value q percent of the keys are rated below, q in [0, 100]."""
+        if not 0 <= q <= 100:
+            raise ValueError('percentile %r not in [0, 100]' % (q,))
+        return self._item(min(len(self) - 1, int(q / 100.0 * len(self))))[0]
+
+
+class ChunkedRatings(Ratings):
+    """Ratings over a chunked sorted list, for millions of keys.
+
+    The (value, key) pairs are kept in sorted lists of `load` to 2 * load
+    pairs, with the last pair of each and a Fenwick tree of their lengths.
+    A change inserts or deletes in one chunk, O(log n + load), instead of
+    moving half of a list of n pairs. rating() and get_*_by_rating() walk
+    the Fenwick tree, O(log n). A chunk is split when it doubles, merged
+    with a neighbour when it halves, then the index is rebuilt, O(n / load)
+    once in about load changes.
+
+    Example:
+    >>> r = ChunkedRatings({'bob': 30, 'john': 20})
+    >>> r.update({'paul': 20, 'tom': 10})
+    >>> r['tom'] = 40
+    >>> r.keys(), r.rating('bob'), r.get_key_by_rating(-1)
+    (['john', 'paul', 'bob', 'tom'], 2, 'tom')
+    >>> del r['john']
+    >>> r.keys_between(20, 40), r.get_val_by_percentile(0)
+    (['paul', 'bob'], 20)
+    """
+    load = 1000
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        pairs = sorted((v, k) for k, v in dict.iteritems(self))
+        load = self.load
+        self._chunks = [pairs[i:i + load]
+                        for i in range(0, len(pairs), load)]
+        self._index()
+
+    def _index(self):
+        """rebuild the last pairs and the Fenwick tree of the chunks."""
+        chunks = self._chunks
+        self._maxes = [chunk[-1] for chunk in chunks]
+        tree = [0] + [len(chunk) for chunk in chunks]
+        for i in range(1, len(tree)):
+            j = i + (i & -i)
+            if j < len(tree):
+                tree[j] += tree[i]
+        self._tree = tree
+        self._step = 1
+        while self._step * 2 < len(tree):
+            self._step *= 2
+
+    def _add(self, ci, n):
+        tree = self._tree
+        i = ci + 1
+        while i < len(tree):
+            tree[i] += n
+            i += i & -i
+
+    def _prefix(self, ci):
+        """how many pairs the chunks before ci hold."""
+        tree = self._tree
+        total = 0
+        while ci:
+            total += tree[ci]
+            ci -= ci & -ci
+        return total
+
+    def _locate(self, rating):
+        """the chunk and the offset in it of the pair rated rating."""
+        if rating < 0:
+            rating += len(self)
+        if not 0 <= rating < len(self):
+            raise IndexError('rating out of range')
+        tree = self._tree
+        pos = 0
+        step = self._step
+        while step:
+            if pos + step < len(tree) and tree[pos + step] <= rating:
+                pos += step
+                rating -= tree[pos]
+            step >>= 1
+        return pos, rating
+
+    def _insert(self, pair):
+        chunks = self._chunks
+        if not chunks:
+            chunks.append([pair])
+            self._index()
+            return
+        ci = bisect_left(self._maxes, pair)
+        if ci == len(chunks):
+            ci -= 1
+        chunk = chunks[ci]
+        insort_left(chunk, pair)
+        self._maxes[ci] = chunk[-1]
+        if len(chunk) > 2 * self.load:
+            chunks[ci:ci + 1] = [chunk[:self.load], chunk[self.load:]]
+            self._index()
+        else:
+            self._add(ci, 1)
+
+    def _remove(self, pair):
+        chunks = self._chunks
+        ci = bisect_left(self._maxes, pair)
+        chunk = chunks[ci]
+        i = bisect_left(chunk, pair)
+        if i == len(chunk) or chunk[i] != pair:
+            raise LookupError("item not found in rating.")
+        del chunk[i]
+        if len(chunk) < self.load // 2 and len(chunks) > 1:
+            # merge into a neighbour, split again if that is too big
+            if ci:
+                ci -= 1
+            merged = chunks[ci] + chunks[ci + 1]
+            if len(merged) > 2 * self.load:
+                half = len(merged) // 2
+                chunks[ci:ci + 2] = [merged[:half], merged[half:]]
+            else:
+                chunks[ci:ci + 2] = [merged]
+            self._index()
+        elif not chunk:
+            del chunks[ci]
+            self._index()
+        else:
+            self._maxes[ci] = chunk[-1]
+            self._add(ci, -1)
+
+    def __setitem__(self, k, v):
+        if k in self:
+            self._remove((self[k], k))
+        dict.__setitem__(self, k, v)
+        self._insert((v, k))
+
+    def __delitem__(self, k):
+        self._remove((self[k], k))
+        dict.__delitem__(self, k)
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            for v, k in chunk:
+                yield k
+
+    iterkeys = __iter__
+
+    def rating(self, key):
+        item = self[key], key
+        i = self._bisect(item)
+        if i < len(self) and item == self._item(i):
+            return i
+        raise LookupError("item not found in rating.")
+
+    def get_val_by_rating(self, rating):
+        return self._item(rating)[0]
+
+    def get_key_by_rating(self, rating):
+        return self._item(rating)[1]
+
+    def _bisect(self, item):
+        ci = bisect_left(self._maxes, item)
+        if ci == len(self._chunks):
+            return len(self)
+        return self._prefix(ci) + bisect_left(self._chunks[ci], item)
+
+    def _item(self, rating):
+        ci, i = self._locate(rating)
+        return self._chunks[ci][i]
+
+    def _items(self, start, stop):
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        ci, i = self._locate(start)
+        result = []
+        n = stop - start
+        while len(result) < n:
+            chunk = self._chunks[ci]
+            result.extend(chunk[i:i + n - len(result)])
+            ci += 1
+            i = 0
+        return result
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the structures in ds/sorting.py.
+
+Usage: python -m snippetpy.ds.sorting_bench [name ...]
+Run without names to run all of them.
+"""
+from __future__ import print_function
+
+import random
+import sys
+from timeit import default_timer
+
+from snippetpy.ds.sorting import Ratings, ChunkedRatings
+
+
+def _per_sec(func, args):
+    start = default_timer()
+    for a in args:
+        func(*a)
+    return len(args) / (default_timer() - start)
+
+
+def bench_ratings(sizes=(100000, 1000000), ops=20000):
+    """A leaderboard: random score updates, rating() and rank lookups of
+    Ratings vs ChunkedRatings, for n keys."""
+    print('%-16s %8s %12s %12s %12s' % ('ratings', 'keys', 'updates/s',
+                                        'rating()/s', 'by rating/s'))
+    for n in sizes:
+        scores = dict((i, random.randint(0, n)) for i in range(n))
+        updates = [(random.randrange(n), random.randint(0, n))
+                   for i in range(ops)]
+        keys = [(random.randrange(n),) for i in range(ops)]
+        ranks = [(random.randrange(n),) for i in range(ops)]
+        for cls in (Ratings, ChunkedRatings):
+            r = cls(scores)
+            print('%-16s %8d %12.0f %12.0f %12.0f' % (
+                cls.__name__, n, _per_sec(r.__setitem__, updates),
+                _per_sec(r.rating, keys),
+                _per_sec(r.get_key_by_rating, ranks)))
+            del r
+
+
+BENCHMARKS = {
+    'ratings': bench_ratings,
+}
+
+
+def main(argv):
+    for name in argv or sorted(BENCHMARKS):
+        print('== %s' % name, file=sys.stderr)
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A hierarchical timing wheel, as described by Varghese & Lauck."""
+import collections
+import heapq
+import itertools
+
+
+class _Slot(dict):
+    """timers of one slot, key -> deadline. level is None once expired."""
+    __slots__ = ('level',)
+
+    def __init__(self, level):
+        dict.__init__(self)
+        self.level = level
+
+
+class TimingWheel(object):
+    """A hierarchical timing wheel of keys and their deadlines.
+
+    There are `levels` wheels of `slots` slots each, a slot of level i spans
+    tick * slots ** i seconds. schedule() and cancel() are O(1). advance()
+    moves the timers of a higher slot down one level when the lower wheel
+    wraps, so a timer is moved at most `levels` times before it expires.
+    Deadlines are rounded up to a tick, so a timer never fires early.
+
+    Expired keys are queued rather than returned, expired(limit) pops them
+    in batches, so the caller can spread a burst over many calls.
+    next_expiry() tells how long the wheel can be left alone, flush(now)
+    expires the timers of the current tick already due at now too.
+
+    Example:
+    >>> w = TimingWheel(tick=1.0, slots=4, levels=2, now=0)
+    >>> w.schedule('a', 3)
+    >>> w.schedule('b', 10)
+    >>> w.schedule('c', 100)
+    >>> w.next_expiry()
+    3.0
+    >>> w.advance(5)
+    >>> w.expired()
+    [('a', 3)]
+    >>> w.cancel('b')
+    True
+    >>> w.next_expiry()
+    12.0
+    >>> w.advance(1000)
+    >>> w.expired()
+    [('c', 100)]
+    >>> len(w)
+    0
+    >>> w.schedule('d', 1000.5)
+    >>> w.advance(1000.7)
+    >>> w.expired()
+    []
+    >>> w.flush(1000.7)
+    >>> w.expired()
+    [('d', 1000.5)]
+    """
+    def __init__(self, tick=1.0, slots=64, levels=4, now=0):
+        if levels < 2:
+            # the timers too far away are parked in the top wheel and
+            # placed again when it cascades, the bottom one never does.
+            raise ValueError('a timing wheel needs at least 2 levels')
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._wheels = [[_Slot(i) for j in range(slots)]
+                        for i in range(levels)]
+        self._spans = [slots ** i for i in range(levels + 1)]
+        self._counts = [0] * levels
+        self._where = {}
+        self._ready = collections.deque()
+        self._current = int(now // tick)
+        # the tick flush() looks at, and a heap of its (deadline, seq, key)
+        self._flush_tick = None
+        self._flush_heap = []
+        self._flush_seq = itertools.count()
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def deadline(self, key, default=None):
+        """the deadline of key, or default if it is not scheduled."""
+        slot = self._where.get(key)
+        if slot is None:
+            return default
+        return slot[key]
+
+    def schedule(self, key, deadline):
+        """(re)schedule key to expire at deadline."""
+        if key in self._where:
+            self.cancel(key)
+        self._place(key, deadline)
+
+    def cancel(self, key):
+        """unschedule key, return False if it was not scheduled."""
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        del slot[key]
+        if slot.level is not None:
+            self._counts[slot.level] -= 1
+        return True
+
+    def clear(self):
+        for wheel in self._wheels:
+            for slot in wheel:
+                slot.clear()
+        self._counts = [0] * self.levels
+        self._where.clear()
+        self._ready.clear()
+        self._flush_tick = None
+
+    def _place(self, key, deadline):
+        t = int(-(-deadline // self.tick))
+        delta = t - self._current
+        if delta <= 0:
+            slot = _Slot(None)
+            self._ready.append(slot)
+        else:
+            spans = self._spans
+            level = 0
+            while level < self.levels - 1 and delta >= spans[level + 1]:
+                level += 1
+            if delta >= spans[self.levels]:
+                # too far away, park it in the farthest slot of the top
+                # wheel, it is placed again when that slot cascades.
+                t = self._current + spans[self.levels] - 1
+            slot = self._wheels[level][(t // spans[level]) % self.slots]
+            self._counts[level] += 1
+        slot[key] = deadline
+        self._where[key] = slot
+        if t == self._flush_tick:
+            heapq.heappush(self._flush_heap,
+                           (deadline, next(self._flush_seq), key))
+
+    def advance(self, now):
+        """move the wheel to now, queueing the timers that expired."""
+        target = int(now // self.tick)
+        spans = self._spans
+        while self._current < target:
+            if not self._where:
+                self._current = target
+                break
+            # nothing happens until the next cascade of the first
+            # non-empty wheel, skip the empty rotations of the lower ones.
+            level = 0
+            while level < self.levels - 1 and not self._counts[level]:
+                level += 1
+            span = spans[level]
+            c = min(target, -(-(self._current + 1) // span) * span)
+            self._current = c
+            for level in range(self.levels - 1, 0, -1):
+                if c % spans[level] == 0:
+                    self._cascade(level, (c // spans[level]) % self.slots)
+            self._expire_slot(c % self.slots)
+
+    def _cascade(self, level, index):
+        slot = self._wheels[level][index]
+        if not slot:
+            return
+        self._wheels[level][index] = _Slot(level)
+        self._counts[level] -= len(slot)
+        slot.level = None
+        where = self._where
+        for key, deadline in slot.items():
+            del where[key]
+            self._place(key, deadline)
+
+    def _expire_slot(self, index):
+        slot = self._wheels[0][index]
+        if not slot:
+            return
+        self._wheels[0][index] = _Slot(0)
+        self._counts[0] -= len(slot)
+        slot.level = None
+        self._ready.append(slot)
+
+    def expired(self, limit=None):
+        """pop up to limit expired (key, deadline) pairs."""
+        result = []
+        ready = self._ready
+        where = self._where
+        while ready and (limit is None or len(result) < limit):
+            slot = ready[0]
+            if not slot:
+                ready.popleft()
+                continue
+            key, deadline = slot.popitem()
+            del where[key]
+            result.append((key, deadline))
+        return result
+
+    def next_expiry(self):
+        """the time from which advance() may expire a timer, None if there
+        is none. It is the time of the next cascade when that comes first,
+        so it may be early but never late."""
+        if not self._where:
+            return None
+        for slot in self._ready:
+            if slot:
+                return self._current * self.tick
+        slots = self.slots
+        first = None
+        for level in range(self.levels):
+            if not self._counts[level]:
+                continue
+            # the slot of tick t at this level expires or cascades at t
+            span = self._spans[level]
+            wheel = self._wheels[level]
+            start = self._current // span + 1
+            for i in range(start, start + slots):
+                if wheel[i % slots]:
+                    if first is None or i * span < first:
+                        first = i * span
+                    break
+        if first is None:
+            return None
+        return first * self.tick
+
+    def flush(self, now):
+        """advance(now), and expire the timers due at now that advance()
+        leaves until the end of the tick now falls in.
+
+        The timers of that tick are sorted on the first call, the next
+        calls in the same tick only pop the due ones.
+        """
+        if now // self.tick > self._current:
+            self.advance(now)
+        t = self._current + 1
+        if self._flush_tick != t:
+            heap = []
+            seq = self._flush_seq
+            for level in range(self.levels):
+                span = self._spans[level]
+                if t % span:
+                    # the higher levels do not cascade at t either
+                    break
+                slot = self._wheels[level][(t // span) % self.slots]
+                heap.extend((deadline, next(seq), key)
+                            for key, deadline in slot.items()
+                            if -(-deadline // self.tick) == t)
+            heapq.heapify(heap)
+            self._flush_tick = t
+            self._flush_heap = heap
+        heap = self._flush_heap
+        if not heap or heap[0][0] > now:
+            return
+        where = self._where
+        ready = None
+        while heap and heap[0][0] <= now:
+            deadline, seq, key = heapq.heappop(heap)
+            slot = where.get(key)
+            # skip the timers cancelled, rescheduled or expired since
+            if slot is None or slot.level is None or \
+                    slot.get(key) != deadline:
+                continue
+            del slot[key]
+            self._counts[slot.level] -= 1
+            if ready is None:
+                ready = _Slot(None)
+                self._ready.append(ready)
+            ready[key] = deadline
+            where[key] = ready